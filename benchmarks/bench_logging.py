@@ -0,0 +1,108 @@
+"""
+Cost of logging on the request path: the queue-based JSON pipeline
+(logs.setup_logging) against the previous synchronous RotatingFileHandler.
+
+    python benchmarks/bench_logging.py --calls 2000 --panels 50
+
+Times blood analyze_and_recommend (one panel, as /api/analyze does) and
+classify_panels over a batch, with logging off, synchronous, queued, and
+queued at DEBUG with per-analyte lines sampled, plus the caller's cost of
+one INFO record. Overhead is relative to logging off; the queue listener's
+file writes happen on its own thread, in the idle gap between calls. With
+a single CPU the listener, woken by each record, preempts the caller, so
+the queued figures there are an upper bound.
+"""
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+from logging.handlers import RotatingFileHandler
+
+from bench_ocr import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'blood-report-check'))
+
+
+def make_panel(rng, reference):
+    results = {}
+    for test_key, bands in reference.items():
+        low, high = bands['male']['range']
+        results[test_key] = {'value': f'{rng.uniform(low * 0.7, high * 1.3):.1f}',
+                             'unit': bands['male']['unit']}
+    return results
+
+
+def time_calls(fn, calls, gap):
+    # Requests are not back to back: the idle gap is when the queue listener
+    # writes, as it would between requests
+    samples = []
+    for _ in range(calls):
+        time.sleep(gap)
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--panels', type=int, default=50, help='panels per classify_panels batch')
+    parser.add_argument('--gap-ms', type=float, default=1.0, help='idle time between calls')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    import logs
+    from reference import REFERENCE
+    from recommendation import analyze_and_recommend, classify_panels
+
+    rng = random.Random(args.seed)
+    panel = make_panel(rng, REFERENCE)
+    batch = [(make_panel(rng, REFERENCE), 'male', None) for _ in range(args.panels)]
+    logger = logging.getLogger('BloodAnalysis')
+    log_dir = tempfile.mkdtemp(prefix='bench_logging_')
+
+    def sync(level):
+        handler = RotatingFileHandler(os.path.join(log_dir, 'sync.log'), maxBytes=int(1e6), backupCount=3)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(level)
+
+    def queued(level):
+        logs.setup_logging(logger, os.path.join(log_dir, 'queued.log'), max_bytes=int(1e6), backup_count=3)
+        logger.setLevel(level)
+
+    modes = [
+        ('off', lambda: logger.setLevel(logging.CRITICAL + 1)),
+        ('sync', lambda: sync(logging.INFO)),
+        ('queued', lambda: queued(logging.INFO)),
+        (f'queued-debug@{logs.LOG_SAMPLE_RATE:g}', lambda: queued(logging.DEBUG)),
+    ]
+    print(f'cpus: {os.cpu_count()}')
+    baseline = {}
+    common = logging.getLogger(logs.COMMON_LOGGER)
+    for name, configure in modes:
+        logger.handlers.clear()
+        common.handlers.clear()
+        configure()
+        # Warm up the reference table and numpy before timing
+        analyze_and_recommend(panel)
+        gap = args.gap_ms / 1000
+        record = time_calls(lambda: logger.info('Compared %d results', 3), args.calls, gap)
+        single = time_calls(lambda: analyze_and_recommend(panel), args.calls, gap)
+        many = time_calls(lambda: classify_panels(batch), max(1, args.calls // 10), gap)
+        for label, samples in (('record', record), ('single', single), (f'batch{args.panels}', many)):
+            p50 = percentile(samples, 50)
+            base = baseline.setdefault(label, p50)
+            print(f'{name:20s} {label:8s} p50={p50:8.1f}us p95={percentile(samples, 95):8.1f}us '
+                  f'overhead={p50 - base:+7.1f}us ({(p50 - base) / base:+.0%})')
+    logger.handlers.clear()
+    common.handlers.clear()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Per-page OCR latency of the pytesseract and tesserocr backends.
+
+    python benchmarks/bench_ocr.py --service blood --pages 20
+
+Backends that are not available on this machine are reported as skipped.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from PIL import Image, ImageDraw, ImageFont
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = {'blood': 'blood-report-check', 'urine': 'urine-report-check'}
+
+SAMPLE_LINES = [
+    "Hemoglobin 13.5 g/dL 13.2 - 16.6",
+    "MCH 29.1 pg 27 - 33",
+    "MCHC 34.2 g/dL 33 - 36",
+    "Platelets 250 10^3/uL 150 - 410",
+    "WBC 7.2 10^3/uL 4.0 - 10.0",
+]
+
+
+def load_font(size):
+    try:
+        return ImageFont.truetype('DejaVuSans.ttf', size)
+    except OSError:
+        return ImageFont.load_default(size=size)
+
+
+def render_page(lines, width=1240, height=1754, font_size=28):
+    """Render text lines onto a white A4 page at roughly 150 DPI."""
+    page = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(page)
+    font = load_font(font_size)
+    y = 80
+    for line in lines:
+        draw.text((80, y), line, fill=0, font=font)
+        y += int(font_size * 1.6)
+    return page
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--service', choices=sorted(SERVICES), default='blood')
+    parser.add_argument('--pages', type=int, default=10)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.join(ROOT, SERVICES[args.service]))
+    import ocr
+
+    pages = [render_page(SAMPLE_LINES * (1 + i % 3)) for i in range(args.pages)]
+    for name in ('pytesseract', 'tesserocr'):
+        backend = ocr.create_backend(name)
+        if backend.name != name:
+            print(f'{name:12s} skipped (not available)')
+            continue
+        try:
+            backend.warm()
+            backend.image_to_string(pages[0], ocr.DEFAULT_CONFIG)
+        except Exception as e:
+            print(f'{name:12s} skipped ({e})')
+            continue
+        samples = []
+        for page in pages:
+            start = time.perf_counter()
+            backend.image_to_string(page, ocr.DEFAULT_CONFIG)
+            samples.append((time.perf_counter() - start) * 1000)
+        print(f'{name:12s} pages={len(samples)} mean={statistics.mean(samples):.1f}ms '
+              f'p50={percentile(samples, 50):.1f}ms p95={percentile(samples, 95):.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
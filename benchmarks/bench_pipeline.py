@@ -0,0 +1,142 @@
+"""
+End-to-end pipeline benchmark over the synthetic corpus, per stage.
+
+    python benchmarks/corpus.py --docs 10
+    python benchmarks/bench_pipeline.py --service all --repeat 3
+
+blood stages: extract_text, extract_entities, analyze_and_recommend
+urine stages: extract_text, parse_report_text, analyze_urine_test
+
+Each service runs in its own subprocess (both ship modules named app, ocr,
+cache, ...). Image kinds are skipped when no tesseract binary is on PATH.
+Use --json to save the numbers and compare runs before deploying.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+from collections import defaultdict
+
+from bench_ocr import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+SERVICES = {'blood': 'blood-report-check', 'urine': 'urine-report-check'}
+OCR_KINDS = ('scan-pdf', 'png-', 'jpeg-')
+
+
+def load_stages(service):
+    """Return [(stage, fn)] where each fn maps the previous stage's output to its own."""
+    service_dir = os.path.join(ROOT, SERVICES[service])
+    sys.path.insert(0, service_dir)
+    os.chdir(service_dir)
+    os.environ.setdefault('WARMUP_ON_START', '0')
+    import app
+
+    if service == 'blood':
+        from extractor import extract_entities
+        from recommendation import analyze_and_recommend
+        return [
+            ('extract_text', lambda path: app.extract_text(path, os.path.splitext(path)[1].lower())),
+            ('extract_entities', extract_entities),
+            ('analyze_and_recommend', analyze_and_recommend),
+        ]
+    return [
+        ('extract_text', lambda path: app.extract_text(path, os.path.splitext(path)[1].lower())),
+        ('parse_report_text', app.parse_report_text),
+        ('analyze_urine_test', app.analyze_urine_test),
+    ]
+
+
+def run_service(service, corpus, repeat, warmup):
+    import logging
+    logging.disable(logging.WARNING)
+
+    with open(os.path.join(corpus, 'manifest.json')) as f:
+        files = [entry for entry in json.load(f)['files'] if entry['service'] == service]
+    if not shutil.which('tesseract'):
+        skipped = sorted({e['kind'] for e in files if e['kind'].startswith(OCR_KINDS)})
+        files = [e for e in files if not e['kind'].startswith(OCR_KINDS)]
+        if skipped:
+            print(f'[{service}] tesseract not found, skipping: {", ".join(skipped)}', file=sys.stderr)
+    paths = [(e['kind'], os.path.join(os.path.abspath(corpus), e['path'])) for e in files]
+    stages = load_stages(service)
+
+    samples = defaultdict(list)  # (kind, stage) -> [ms]
+    totals = defaultdict(float)  # kind -> seconds across all stages
+    counts = defaultdict(int)
+    for round_no in range(warmup + repeat):
+        for kind, path in paths:
+            value = path
+            for stage, fn in stages:
+                start = time.perf_counter()
+                value = fn(value)
+                elapsed = time.perf_counter() - start
+                if round_no >= warmup:
+                    samples[(kind, stage)].append(elapsed * 1000)
+                    totals[kind] += elapsed
+            if round_no >= warmup:
+                counts[kind] += 1
+
+    report = {'service': service, 'kinds': {}}
+    for kind in sorted(counts):
+        report['kinds'][kind] = {
+            'docs': counts[kind],
+            'docs_per_sec': counts[kind] / totals[kind] if totals[kind] else None,
+            'stages': {
+                stage: {f'p{p}': percentile(samples[(kind, stage)], p) for p in (50, 95, 99)}
+                for stage, _ in stages
+            },
+        }
+    all_docs = sum(counts.values())
+    report['docs_per_sec'] = all_docs / sum(totals.values()) if totals else None
+    return report
+
+
+def print_report(report):
+    print(f"\n== {report['service']} ==  overall {report['docs_per_sec'] or 0:.1f} docs/sec")
+    for kind, data in report['kinds'].items():
+        print(f"{kind:10s} docs={data['docs']:<4d} {data['docs_per_sec'] or 0:8.1f} docs/sec")
+        for stage, pct in data['stages'].items():
+            print(f"    {stage:22s} p50={pct['p50']:8.2f}ms p95={pct['p95']:8.2f}ms p99={pct['p99']:8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--service', choices=sorted(SERVICES) + ['all'], default='all')
+    parser.add_argument('--corpus', default=os.path.join(HERE, 'corpus'))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=1, help='untimed passes over the corpus')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.corpus, 'manifest.json')):
+        parser.error(f'no corpus at {args.corpus}; run benchmarks/corpus.py first')
+
+    if args.child:
+        # Keep anything the services print off the stdout channel used for results
+        result_out, sys.stdout = sys.stdout, sys.stderr
+        json.dump(run_service(args.service, args.corpus, args.repeat, args.warmup), result_out)
+        return
+
+    services = sorted(SERVICES) if args.service == 'all' else [args.service]
+    reports = []
+    for service in services:
+        cmd = [sys.executable, os.path.abspath(__file__), '--child', '--service', service,
+               '--corpus', os.path.abspath(args.corpus),
+               '--repeat', str(args.repeat), '--warmup', str(args.warmup)]
+        out = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, text=True).stdout
+        reports.append(json.loads(out))
+        print_report(reports[-1])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Two-pass region-of-interest OCR against full-page OCR on blood report images.
+
+    python benchmarks/corpus.py --docs 10
+    python benchmarks/bench_roi.py --repeat 3
+
+For every png/jpeg report in the corpus both modes OCR the same enhanced
+page. Reports latency percentiles, the pixels each mode reads, and whether
+extract_entities finds the same analytes and values from both texts.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+
+from bench_ocr import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--corpus', default=os.path.join(HERE, 'corpus'))
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+    if not shutil.which('tesseract'):
+        sys.exit('tesseract not found on PATH')
+
+    sys.path.insert(0, os.path.join(ROOT, 'blood-report-check'))
+    import roi
+    from ocr import ocr_image
+    from preprocess import prepare_for_ocr
+    from extractor import extract_entities
+
+    with open(os.path.join(args.corpus, 'manifest.json')) as f:
+        paths = [os.path.join(args.corpus, e['path']) for e in json.load(f)['files']
+                 if e['service'] == 'blood' and e['kind'].startswith(('png-', 'jpeg-'))]
+    pages = [prepare_for_ocr(path) for path in paths]
+
+    full_ms, roi_ms, fractions, agree = [], [], [], 0
+    for page in pages:
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            full_text = ocr_image(page)
+            full_ms.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            roi_text = roi.ocr_rows(page)
+            roi_ms.append((time.perf_counter() - start) * 1000)
+        bands = roi.locate_rows(page)
+        read = roi.stitch_rows(page, bands) if bands else page
+        fractions.append(roi.ROI_LOCATE_SCALE ** 2 + read.width * read.height / (page.width * page.height))
+        agree += extract_entities(full_text) == extract_entities(roi_text)
+
+    for name, samples in (('full-page', full_ms), ('roi', roi_ms)):
+        print(f'{name:10s} pages={len(samples)} p50={percentile(samples, 50):.1f}ms '
+              f'p95={percentile(samples, 95):.1f}ms')
+    p50_full, p50_roi = percentile(full_ms, 50), percentile(roi_ms, 50)
+    print(f'latency change p50: {(p50_roi - p50_full) / p50_full:+.0%}')
+    print(f'pixels read vs full page: mean {sum(fractions) / len(fractions):.0%} '
+          f'(max {max(fractions):.0%}, both passes)')
+    print(f'same analytes and values: {agree}/{len(pages)} pages')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+Micro-benchmark of urine parse_report_text against the previous
+implementation (one re.search per field over the whole report).
+
+    python benchmarks/bench_urine_parse.py --sections 1 10 50
+
+Also checks that both implementations produce the same data dict.
+"""
+import os
+import re
+import sys
+import time
+import random
+import logging
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICE_DIR = os.path.join(ROOT, 'urine-report-check')
+
+log = logging.getLogger(__name__)
+
+FILLER = [
+    "Patient Name: John Doe    Age: 42    Sample: Midstream urine",
+    "Collected: 2024-03-02 08:15    Reported: 2024-03-02 11:40",
+    "Method: Automated analyser, verified by consultant pathologist",
+    "Note: results relate only to the sample as received.",
+    "Interpretation should be correlated with clinical findings.",
+]
+
+
+def make_section(rng):
+    lines = [
+        "Physical Examination",
+        f"Color: {rng.choice(['Pale yellow', 'Yellow', 'Dark yellow', 'Red'])}",
+        f"Clarity: {rng.choice(['Clear', 'Slightly cloudy', 'Turbid'])}",
+        f"Odor: {rng.choice(['Normal', 'Fruity', 'Foul'])}",
+        "Chemical Examination",
+        f"pH: {rng.uniform(4.0, 9.0):.1f}",
+        f"Specific Gravity: {rng.uniform(1.000, 1.040):.3f}",
+        f"Protein: {rng.randint(0, 60)} mg/dL",
+        f"Glucose: {rng.choice(['negative', 'positive'])}",
+        f"Ketones: {rng.choice(['negative', 'positive'])}",
+        f"Blood: {rng.choice(['negative', 'positive'])}",
+        f"Nitrites: {rng.choice(['negative', 'positive'])}",
+        f"Leukocyte Esterase: {rng.choice(['negative', 'positive'])}",
+        f"Microalbumin: {rng.randint(5, 80)} mg/day",
+        "Microscopic Examination",
+        f"RBC: {rng.randint(0, 10)}",
+        f"WBC: {rng.randint(0, 12)}",
+        f"Casts: {rng.choice(['None', 'Hyaline', 'Granular'])}",
+        f"Crystals: {rng.choice(['None', 'Calcium oxalate'])}",
+        f"Epithelial cells: {rng.randint(0, 9)}",
+        "Culture",
+        f"Bacterial Load: {rng.choice(['1e3', '5e4', '2e5'])}",
+        f"Lactobacillus gasseri: {rng.randint(40, 95)}",
+        f"Escherichia coli: {rng.randint(0, 30)}",
+        f"Klebsiella pneumoniae: {rng.randint(0, 5)}",
+        f"24-hour urine volume: {rng.randint(400, 4000)} mL",
+        f"Pregnancy Test: {rng.choice(['Positive', 'Negative'])}",
+    ]
+    lines.extend(rng.sample(FILLER, 3))
+    return lines
+
+
+def make_report(sections, seed=0):
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(sections):
+        lines.extend(make_section(rng))
+    return "\n".join(lines)
+
+
+def legacy_parse_report_text(text):
+    data = {}
+    chem_data = {}
+    microscopic_data = {}
+    micro_data = {}
+    rapid_data = {}
+    pregnancy_data = {}
+
+    try:
+        # Chemical Analysis
+        m = re.search(r"pH[:\s]+([\d\.]+)", text, re.IGNORECASE)
+        if m: chem_data["pH"] = float(m.group(1))
+        m = re.search(r"Color[:\s]+([\w\s]+)", text, re.IGNORECASE)
+        if m: chem_data["color"] = m.group(1).strip()
+        m = re.search(r"Clarity[:\s]+([\w\s]+)", text, re.IGNORECASE)
+        if m: chem_data["clarity"] = m.group(1).strip()
+        m = re.search(r"Odor[:\s]+([\w\s]+)", text, re.IGNORECASE)
+        if m: chem_data["odor"] = m.group(1).strip()
+        m = re.search(r"Specific\s*Gravity[:\s]+([\d\.]+)", text, re.IGNORECASE)
+        if m: chem_data["specific_gravity"] = float(m.group(1))
+        m = re.search(r"Protein[:\s]+([\d\.]+)\s*mg/dL", text, re.IGNORECASE)
+        if m: chem_data["protein"] = float(m.group(1))
+        m = re.search(r"Glucose[:\s]+(negative|positive)", text, re.IGNORECASE)
+        if m: chem_data["glucose"] = m.group(1).lower()
+        m = re.search(r"Ketones[:\s]+(negative|positive)", text, re.IGNORECASE)
+        if m: chem_data["ketones"] = m.group(1).lower()
+        m = re.search(r"Blood[:\s]+(negative|positive)", text, re.IGNORECASE)
+        if m: chem_data["blood"] = m.group(1).lower()
+        m = re.search(r"Nitrites[:\s]+(negative|positive)", text, re.IGNORECASE)
+        if m: chem_data["nitrites"] = m.group(1).lower()
+        m = re.search(r"Leukocyte\s*Esterase[:\s]+(negative|positive)", text, re.IGNORECASE)
+        if m: chem_data["leukocyte_esterase"] = m.group(1).lower()
+        m = re.search(r"Microalbumin[:\s]+([\d\.]+)\s*mg/day", text, re.IGNORECASE)
+        if m: chem_data["microalbumin"] = float(m.group(1))
+        if chem_data:
+            data["chem_data"] = chem_data
+    except Exception as e:
+        log.error(f"Error parsing chemical data: {e}")
+
+    try:
+        # Microscopic Analysis
+        m = re.search(r"RBC[:\s]+([\d\.]+)", text, re.IGNORECASE)
+        if m: microscopic_data["rbc"] = float(m.group(1))
+        m = re.search(r"WBC[:\s]+([\d\.]+)", text, re.IGNORECASE)
+        if m: microscopic_data["wbc"] = float(m.group(1))
+        m = re.search(r"Casts[:\s]+([\w\s]+)", text, re.IGNORECASE)
+        if m: microscopic_data["casts"] = m.group(1).strip()
+        m = re.search(r"Crystals[:\s]+([\w\s]+)", text, re.IGNORECASE)
+        if m: microscopic_data["crystals"] = m.group(1).strip()
+        m = re.search(r"Epithelial\s*cells?[:\s]+([\d\.]+)", text, re.IGNORECASE)
+        if m: microscopic_data["epithelial_cells"] = float(m.group(1))
+        if microscopic_data:
+            data["microscopic_data"] = microscopic_data
+    except Exception as e:
+        log.error(f"Error parsing microscopic data: {e}")
+
+    try:
+        # Microbiology
+        m = re.search(r"Bacterial\s*Load[:\s]+([\d\.e\+]+)", text, re.IGNORECASE)
+        if m:
+            try:
+                micro_data["bacterial_load"] = float(m.group(1))
+            except ValueError:
+                micro_data["bacterial_load"] = 0.0
+        m = re.search(r"Lactobacillus\s*gasseri[:\s]+([\d\.]+)", text, re.IGNORECASE)
+        if m:
+            micro_data.setdefault("microbial_composition", {})["lactobacillus gasseri"] = float(m.group(1))
+        m = re.search(r"Enterococcus\s*faecalis[:\s]+([\d\.]+)", text, re.IGNORECASE)
+        if m:
+            micro_data.setdefault("microbial_composition", {})["enterococcus faecalis"] = float(m.group(1))
+        m = re.search(r"Actinomyces\s*neuii[:\s]+([\d\.]+)", text, re.IGNORECASE)
+        if m:
+            micro_data.setdefault("microbial_composition", {})["actinomyces neuii"] = float(m.group(1))
+        m = re.search(r"Escherichia\s*coli[:\s]+([\d\.]+)", text, re.IGNORECASE)
+        if m:
+            micro_data.setdefault("microbial_composition", {})["escherichia coli"] = float(m.group(1))
+
+        detected = []
+        for pathogen in ["Escherichia coli", "Klebsiella pneumoniae", "Staphylococcus aureus"]:
+            pattern = re.compile(re.escape(pathogen) + r"[:\s]+([\d\.]+)", re.IGNORECASE)
+            m = pattern.search(text)
+            if m and float(m.group(1)) > 0:
+                detected.append(pathogen)
+        if detected:
+            micro_data["detected_pathogens"] = detected
+        if re.search(r"resistance gene", text, re.IGNORECASE):
+            micro_data["resistance_genes"] = ["Aminoglycoside resistance gene"]
+        if micro_data:
+            data["micro_data"] = micro_data
+    except Exception as e:
+        log.error(f"Error parsing microbiology data: {e}")
+
+    try:
+        # 24-Hour Urine Volume
+        m = re.search(r"24[-\s]*(hour|hr)\s*urine\s*volume[:\s]+([\d\.]+)\s*mL", text, re.IGNORECASE)
+        if m:
+            data["urine_volume"] = float(m.group(2))
+    except Exception as e:
+        log.error(f"Error parsing urine volume: {e}")
+
+    try:
+        # Rapid Urine Test
+        rapid_dict = {}
+        for param in ["nitrites", "leukocyte_esterase", "glucose", "protein", "blood"]:
+            m = re.search(param + r"[:\s]+(negative|positive)", text, re.IGNORECASE)
+            if m:
+                rapid_dict[param] = m.group(1).lower()
+        if rapid_dict:
+            data["rapid_data"] = rapid_dict
+    except Exception as e:
+        log.error(f"Error parsing rapid urine data: {e}")
+
+    try:
+        # Pregnancy Test
+        m = re.search(r"Pregnancy\s*Test[:\s]+(Positive|Negative)", text, re.IGNORECASE)
+        if m:
+            pregnancy_data["result"] = m.group(1)
+        else:
+            m = re.search(r"hCG[:\s]+([\d\.]+)\s*mIU/mL", text, re.IGNORECASE)
+            if m:
+                pregnancy_data["hcg"] = float(m.group(1))
+        if pregnancy_data:
+            data["pregnancy_data"] = pregnancy_data
+    except Exception as e:
+        log.error(f"Error parsing pregnancy data: {e}")
+
+    data["test_type"] = "full"
+    return data
+
+
+def bench(fn, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sections', type=int, nargs='+', default=[1, 10, 50, 200])
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    # app.py creates its upload/log directory relative to the working directory
+    os.chdir(SERVICE_DIR)
+    sys.path.insert(0, SERVICE_DIR)
+    from app import parse_report_text
+
+    for sections in args.sections:
+        text = make_report(sections, seed=sections)
+        assert parse_report_text(text) == legacy_parse_report_text(text), f'mismatch at {sections} sections'
+        old = bench(legacy_parse_report_text, text, args.repeat)
+        new = bench(parse_report_text, text, args.repeat)
+        print(f'sections={sections:4d} chars={len(text):8d} legacy={old:8.3f}ms '
+              f'scanner={new:8.3f}ms speedup={old / new:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
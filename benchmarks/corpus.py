@@ -0,0 +1,187 @@
+"""
+Generate a reproducible synthetic lab-report corpus for the benchmarks.
+
+    python benchmarks/corpus.py --out benchmarks/corpus --docs 10 --seed 0
+
+For each service it writes text-layer PDFs, scanned-image PDFs, PNG/JPEG
+scans at several DPIs and DICOM files, plus a manifest.json listing every
+file with its kind. The same seed always produces the same reports.
+"""
+import os
+import json
+import random
+import argparse
+from PIL import Image, ImageDraw
+
+from bench_ocr import load_font
+from bench_urine_parse import make_section as make_urine_section
+
+SERVICES = ('blood', 'urine')
+SCAN_DPIS = (100, 200, 300)
+
+BLOOD_ANALYTES = [
+    # (label, unit, low, high)
+    ("Hemoglobin", "g/dL", 9.0, 18.0),
+    ("Hematocrit", "%", 30, 52),
+    ("RBC", "10^6/uL", 3.5, 6.0),
+    ("WBC", "10^3/uL", 3.0, 13.0),
+    ("Platelets", "10^3/uL", 120, 450),
+    ("MCH", "pg", 24, 36),
+    ("MCHC", "g/dL", 31, 38),
+    ("Fasting Plasma Glucose", "mg/dL", 70, 160),
+    ("HbA1c", "%", 4.5, 9.0),
+    ("Total Cholesterol", "mg/dL", 140, 280),
+    ("Triglycerides", "mg/dL", 60, 300),
+    ("Serum Creatinine", "mg/dL", 0.5, 1.8),
+    ("TSH", "mIU/L", 0.3, 6.0),
+]
+
+BLOOD_FILLER = [
+    "Patient Name: John Doe    Age: 42    Sex: M",
+    "Collected: 2024-03-02 08:15    Reported: 2024-03-02 11:40",
+    "Sample: EDTA whole blood / serum",
+    "Method: Automated analyser, verified by consultant pathologist",
+    "Interpretation should be correlated with clinical findings.",
+]
+
+
+def make_blood_lines(rng):
+    lines = ["Complete Blood Count and Biochemistry", rng.choice(BLOOD_FILLER)]
+    for label, unit, low, high in rng.sample(BLOOD_ANALYTES, rng.randint(6, len(BLOOD_ANALYTES))):
+        lines.append(f"{label} {rng.uniform(low, high):.1f} {unit}")
+    lines.extend(rng.sample(BLOOD_FILLER, 2))
+    return lines
+
+
+def make_lines(service, rng):
+    return make_blood_lines(rng) if service == 'blood' else make_urine_section(rng)
+
+
+def paginate(lines, per_page=40):
+    return [lines[i:i + per_page] for i in range(0, len(lines), per_page)] or [[]]
+
+
+def text_pdf(pages):
+    """Build a minimal PDF with a Helvetica text layer, one list of lines per page."""
+    objs = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    n = len(pages)
+    font_id = 3 + 2 * n
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(n))
+    objs.append(f"<< /Type /Pages /Kids [{kids}] /Count {n} >>".encode())
+    for i, lines in enumerate(pages):
+        ops = ["BT /F1 11 Tf 14 TL 50 780 Td"]
+        for line in lines:
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            ops.append(f"({escaped}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode('latin-1', 'replace')
+        objs.append((f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {4 + 2 * i} 0 R "
+                     f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>").encode())
+        objs.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objs.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, obj in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    return bytes(out)
+
+
+def render_scan(lines, dpi, rng):
+    """Render lines onto an A4 page at the given DPI with slight rotation and noise."""
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    page = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(page)
+    font_size = max(10, dpi // 7)
+    font = load_font(font_size)
+    y = dpi // 2
+    for line in lines:
+        draw.text((dpi // 2, y), line, fill=rng.randint(0, 60), font=font)
+        y += int(font_size * 1.6)
+    for _ in range(width * height // 2000):
+        draw.point((rng.randrange(width), rng.randrange(height)), fill=rng.randint(120, 220))
+    return page.rotate(rng.uniform(-1.0, 1.0), fillcolor=255, expand=False)
+
+
+def write_dicom(path, service, lines, page):
+    """Secondary-capture DICOM carrying the report text and a downsampled scan."""
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, SecondaryCaptureImageStorage, generate_uid
+
+    meta = FileMetaDataset()
+    meta.MediaStorageSOPClassUID = SecondaryCaptureImageStorage
+    meta.MediaStorageSOPInstanceUID = generate_uid()
+    meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+    ds = Dataset()
+    ds.file_meta = meta
+    ds.SOPClassUID = meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = meta.MediaStorageSOPInstanceUID
+    ds.Modality = 'OT'
+    ds.PatientName = 'Doe^John'
+    ds.PatientID = 'BENCH0001'
+    ds.StudyDescription = f'{service.title()} report'
+    ds.PatientComments = "\n".join(lines)
+
+    image = page.resize((page.width // 2, page.height // 2))
+    ds.Rows, ds.Columns = image.height, image.width
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = 'MONOCHROME2'
+    ds.BitsAllocated = 8
+    ds.BitsStored = 8
+    ds.HighBit = 7
+    ds.PixelRepresentation = 0
+    ds.PixelData = image.tobytes()
+    ds.save_as(path, enforce_file_format=True)
+
+
+def generate(out_dir, docs, seed):
+    manifest = []
+    for service in SERVICES:
+        service_dir = os.path.join(out_dir, service)
+        os.makedirs(service_dir, exist_ok=True)
+        rng = random.Random(f'{seed}-{service}')
+
+        def add(kind, name, writer):
+            path = os.path.join(service_dir, name)
+            writer(path)
+            manifest.append({'service': service, 'kind': kind, 'path': os.path.relpath(path, out_dir)})
+
+        for i in range(docs):
+            lines = make_lines(service, rng)
+            pages = paginate(lines)
+            scan = render_scan(lines, 200, rng)
+
+            pdf = text_pdf(pages)
+            add('text-pdf', f'text-{i:03d}.pdf', lambda p: open(p, 'wb').write(pdf))
+            add('scan-pdf', f'scan-{i:03d}.pdf', lambda p: scan.save(p, 'PDF', resolution=200))
+            for dpi in SCAN_DPIS:
+                image = scan if dpi == 200 else render_scan(lines, dpi, rng)
+                add(f'png-{dpi}', f'scan-{i:03d}-{dpi}.png', lambda p: image.save(p, dpi=(dpi, dpi)))
+                add(f'jpeg-{dpi}', f'scan-{i:03d}-{dpi}.jpg', lambda p: image.save(p, quality=85, dpi=(dpi, dpi)))
+            add('dicom', f'report-{i:03d}.dcm', lambda p: write_dicom(p, service, lines, scan))
+
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump({'seed': seed, 'docs': docs, 'files': manifest}, f, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--out', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus'))
+    parser.add_argument('--docs', type=int, default=10, help='reports per service')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    manifest = generate(args.out, args.docs, args.seed)
+    print(f'Wrote {len(manifest)} files to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import os
+import re
+import json
+import functools
+
+ANALYTES_FILE = os.environ.get('ANALYTES_FILE', os.path.join(os.path.dirname(__file__), 'analytes.json'))
+
+# Word runs, or single punctuation marks, so "troponin-i" and "ck-mb" are token
+# sequences and whitespace differences between synonyms do not matter
+TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+_END = ''  # trie key marking the end of a synonym; never a token
+
+
+class AnalyteIndex:
+    """
+    Token trie over every analyte synonym, each mapped to one canonical key.
+    Matching walks at most the longest synonym's length from each token, so
+    the cost is linear in the text and independent of the dictionary size.
+    """
+
+    def __init__(self, synonyms):
+        self.trie = {}
+        for name, key in synonyms.items():
+            tokens = TOKEN_RE.findall(name.lower())
+            if not tokens:
+                continue
+            node = self.trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node[_END] = key
+        self.keys = frozenset(synonyms.values())
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            entries = json.load(f)['analytes']
+        synonyms = {}
+        for entry in entries:
+            for name in [entry['key'], *entry.get('names', [])]:
+                if synonyms.setdefault(name.lower(), entry['key']) != entry['key']:
+                    raise ValueError(f"Synonym {name!r} maps to both {synonyms[name.lower()]} and {entry['key']}")
+        return cls(synonyms)
+
+    def finditer(self, line):
+        """
+        Yield (key, start, end) for analyte names in a lowercased line,
+        leftmost-longest and non-overlapping, matching whole tokens only.
+        """
+        tokens = [(m.group(), m.start(), m.end()) for m in TOKEN_RE.finditer(line)]
+        i = 0
+        while i < len(tokens):
+            node = self.trie.get(tokens[i][0])
+            best = None
+            j = i
+            while node is not None:
+                if _END in node:
+                    best = (node[_END], j)
+                j += 1
+                if j == len(tokens):
+                    break
+                node = node.get(tokens[j][0])
+            if best is None:
+                i += 1
+                continue
+            key, last = best
+            yield key, tokens[i][1], tokens[last][2]
+            i = last + 1
+
+
+@functools.lru_cache(maxsize=None)
+def get_index(path=ANALYTES_FILE):
+    return AnalyteIndex.from_file(path)
@@ -1,41 +1,136 @@
+import io
 import os
+import json
 import uuid
 import logging
+import tempfile
 import traceback
-from logging.handlers import RotatingFileHandler
-from flask import Flask, request, jsonify, render_template
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, g, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
-from PIL import Image
-import pytesseract
-import pdfplumber
-import pydicom
-import cv2
-import numpy as np
-from extractor import extract_entities
-from recommendation import analyze_and_recommend
+from extractor import extract_entities, analyte_hit_rate
+from recommendation import analyze_and_recommend, iter_findings, render_recommendations
+from units import get_conversion_table
+from reference import get_reference_table
+from cache import ResultCache, make_key
+from ocr import ocr_image, ocr_pdf_pages, get_backend
+from roi import ocr_rows
+from tiers import ocr_tiered
+from jobs import JobFailed, JobQueue, QueueFull
+from startup import HEAVY_MODULES, load, start_warmup, ready, report
+from metrics import stage, count_file, count_failure, render as render_metrics
+from profiling import profiled, profiled_stream
+from concurrency import Saturated, RETRY_AFTER, admit, admitted
+from logs import setup_logging, correlation
+from deadline import DeadlineExceeded, budget, limited, expired, check, mark_partial, is_partial
+from validation import MAX_CONTENT_LENGTH, UploadRejected, UploadRequest, validate_upload
 
 BASE_DIR = os.path.dirname(__file__)
 UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'dcm'}
 
+# Result cache for resubmitted reports (0 entries disables it)
+RESULT_CACHE_ENTRIES = int(os.environ.get('RESULT_CACHE_ENTRIES', 256))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', 3600))
+
+# Process pool size for OCR of scanned PDF pages (1 = OCR pages in-process)
+OCR_PAGE_WORKERS = int(os.environ.get('OCR_PAGE_WORKERS', 1))
+
+# Stream PDFs page by page and stop once every analyte in PDF_TARGET_ANALYTES
+# (comma-separated keys as returned by extract_entities, e.g. "hemoglobin,mch")
+# has been found or PDF_PAGE_BUDGET pages have been read (0 = no page limit).
+# With neither set, every page is read and scanned pages may use the OCR pool.
+PDF_TARGET_ANALYTES = frozenset(
+    key.strip().lower() for key in os.environ.get('PDF_TARGET_ANALYTES', '').split(',') if key.strip())
+PDF_PAGE_BUDGET = int(os.environ.get('PDF_PAGE_BUDGET', 0))
+
+# Two-pass OCR of image reports and DICOM frames: locate the analyte rows on a
+# downscaled page, then OCR only those rows at full resolution. PDF pages are
+# rendered too small for the locate pass and are always OCR'd whole. With
+# OCR_TIERED on, only pages escalated past the light tier are read this way.
+OCR_ROI = os.environ.get('OCR_ROI', '0') == '1'
+
+# Tiered OCR of image reports: OCR the plain grayscale page first and only
+# denoise/binarise and OCR again when confidence or analyte hit rate is low
+# (thresholds in tiers.py). Off = always the full preprocessing.
+OCR_TIERED = os.environ.get('OCR_TIERED', '0') == '1'
+
+# Uploads up to this size are processed from memory; larger ones spill to
+# UPLOAD_DIR (0 = always write uploads to disk)
+UPLOAD_SPOOL_THRESHOLD = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD', 8 * 1024 * 1024))
+
+# Background analysis jobs (POST /api/analyze?async=1, then GET /jobs/<id>)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_QUEUE_DEPTH = int(os.environ.get('JOB_QUEUE_DEPTH', 32))
+JOB_RETENTION = int(os.environ.get('JOB_RETENTION', 900))
+# Job state, shared by every server worker process so any of them can answer a poll.
+# Must be on node-local disk: SQLite's WAL mode does not work on network
+# filesystems, which is what UPLOAD_DIR may be (a PVC shared by replicas).
+JOB_STORE = os.environ.get('JOB_STORE', os.path.join(tempfile.gettempdir(), 'blood-jobs.sqlite3'))
+
+# Multi-file uploads to /api/analyze/batch
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 16))
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 4))
+
+# Import heavy dependencies and initialise OCR in the background at startup;
+# /ready reports 503 until this finishes (0 = fully lazy, ready immediately)
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', '1') == '1'
+
+# False in page-OCR pool processes: they are spawned and, under
+# `python app.py`, re-run this file as __mp_main__. They need none of the
+# service's logging, job store or warm-up.
+SERVICE_PROCESS = __name__ != '__mp_main__'
+
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+app.request_class = UploadRequest
 CORS(app)
 
+# JSON lines, written off the request path by a background thread (logs.py)
 logger = logging.getLogger('BloodAnalysis')
-logger.setLevel(logging.INFO)
-LOG_FILE = os.path.join(UPLOAD_DIR, 'blood_analysis.log')  
-handler = RotatingFileHandler(LOG_FILE, maxBytes=int(1e6), backupCount=3)
-handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-logger.addHandler(handler)
+LOG_FILE = os.path.join(UPLOAD_DIR, 'blood_analysis.log')
+if SERVICE_PROCESS:
+    setup_logging(logger, LOG_FILE, max_bytes=int(1e6), backup_count=3)
 
+result_cache = ResultCache(RESULT_CACHE_ENTRIES, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL)
+job_queue = JobQueue(JOB_STORE, JOB_WORKERS, JOB_QUEUE_DEPTH, JOB_RETENTION) if SERVICE_PROCESS else None
+batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
 
 @app.errorhandler(400)
 def bad_request(error):
     logger.error(f"400 Error: {error}")
     return jsonify({'error': 'Bad request', 'details': str(error)}), 400
 
+@app.errorhandler(413)
+def too_large(error):
+    logger.warning(f"413 Error: {error}")
+    count_failure('too_large')
+    return jsonify({'error': 'File too large', 'details': f'Max upload size is {MAX_CONTENT_LENGTH} bytes'}), 413
+
+@app.errorhandler(UploadRejected)
+def upload_rejected(error):
+    logger.warning(f"{error.status} Upload rejected: {error}")
+    count_failure('rejected')
+    return jsonify({'error': 'Invalid file', 'details': str(error)}), error.status
+
+@app.errorhandler(Saturated)
+def saturated(error):
+    logger.warning(f"503 Saturated: {error}")
+    count_failure('saturated')
+    response = jsonify({'error': 'Server busy, retry later'})
+    response.headers['Retry-After'] = str(RETRY_AFTER)
+    return response, 503
+
+@app.errorhandler(DeadlineExceeded)
+def deadline_exceeded(error):
+    logger.warning(f"504 Deadline exceeded: {error}")
+    count_failure('deadline')
+    return jsonify({'error': 'Analysis timed out', 'details': str(error)}), 504
+
 @app.errorhandler(500)
 def server_error(error):
     logger.error(f"500 Error: {error}")
@@ -44,94 +139,497 @@ def server_error(error):
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def enhance_image(image):
+def enhance_image(source):
+    """Rescale to OCR resolution and binarise; falls back to the raw image."""
     try:
-        arr = np.array(image)
-        gray = cv2.cvtColor(arr, cv2.COLOR_BGR2GRAY)
-        blur = cv2.medianBlur(gray, 3)
-        thresh = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-        return Image.fromarray(thresh)
+        return load('preprocess').prepare_for_ocr(source)
     except Exception as e:
         logger.error(f'Image enhancement failed: {e}')
-        return image
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return load('PIL.Image').open(source)
+
+def ocr_page(image):
+    """OCR one page image, reading only the analyte rows when OCR_ROI is on."""
+    return ocr_rows(image) if OCR_ROI else ocr_image(image)
+
+def budget_spent(what):
+    """Record that the time budget cut extraction short; the result is partial."""
+    logger.warning(f'Time budget exhausted: {what}')
+    count_failure('deadline_partial')
+    mark_partial()
+
+def upload_source(content, name):
+    """
+    Wrap uploaded bytes for extraction: an in-memory buffer up to
+    UPLOAD_SPOOL_THRESHOLD, otherwise a spill file under UPLOAD_DIR.
+    Returns (source, spill_path); spill_path is None for in-memory sources.
+    """
+    if len(content) <= UPLOAD_SPOOL_THRESHOLD:
+        return io.BytesIO(content), None
+    spill_path = os.path.join(UPLOAD_DIR, name)
+    with stage('upload_save'), open(spill_path, 'wb') as out:
+        out.write(content)
+    return spill_path, spill_path
 
-def extract_text(file_path, extension):
+def extract_text(source, extension):
+    """Extract report text from a file path or a seekable file-like object."""
     try:
         if extension in {'.png', '.jpg', '.jpeg'}:
-            img = Image.open(file_path)
-            img = enhance_image(img)
-            return pytesseract.image_to_string(img, config='--psm 11')
+            if OCR_TIERED:
+                return ocr_tiered(source, analyte_hit_rate, ocr_page)
+            with stage('enhance_image'):
+                img = enhance_image(source)
+            with stage('ocr'):
+                return ocr_page(img)
         elif extension == '.pdf':
-            text = ''
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text() or ''
-                    if not page_text:
-                        page_text = pytesseract.image_to_string(page.to_image().original, config='--psm 11')
-                    text += page_text
-            return text
+            with load('pdfplumber').open(source) as pdf:
+                if PDF_TARGET_ANALYTES or PDF_PAGE_BUDGET:
+                    return stream_pdf_text(pdf)
+                page_texts = []
+                with stage('pdf_text'):
+                    for page in pdf.pages:
+                        if expired():
+                            break
+                        page_texts.append(page.extract_text() or '')
+                scanned = [i for i, page_text in enumerate(page_texts) if not page_text]
+                ocr_texts = {}  # page index -> text; pages the budget cut off are missing
+                try:
+                    if OCR_PAGE_WORKERS > 1 and len(scanned) > 1:
+                        # Pool workers need a picklable source: the path or the raw bytes
+                        pool_source = source.getvalue() if isinstance(source, io.BytesIO) else source
+                        with stage('ocr'):
+                            ocr_texts = ocr_pdf_pages(pool_source, scanned, OCR_PAGE_WORKERS)
+                    else:
+                        for i in scanned:
+                            check()
+                            with stage('ocr'):
+                                ocr_texts[i] = ocr_image(pdf.pages[i].to_image().original)
+                except DeadlineExceeded:
+                    pass
+                if len(page_texts) < len(pdf.pages) or len(ocr_texts) < len(scanned):
+                    budget_spent(f'read {len(page_texts)} of {len(pdf.pages)} PDF pages, '
+                                 f'OCR\'d {len(ocr_texts)} of {len(scanned)} scanned')
+            for i, page_text in ocr_texts.items():
+                page_texts[i] = page_text
+            return '\n'.join(page_texts)
         elif extension == '.dcm':
-            ds = pydicom.dcmread(file_path)
-            return f"{ds.get('StudyDescription', '')} {ds.get('PatientComments', '')}"
+            dicom_reader = load('dicom_reader')
+            with stage('dicom_read'):
+                ds = dicom_reader.read_header(source, ['StudyDescription', 'PatientComments'])
+            text = f"{ds.get('StudyDescription', '')} {ds.get('PatientComments', '')}"
+            if dicom_reader.wants_ocr(ds, str(ds.get('PatientComments', ''))):
+                with stage('ocr'):
+                    text += '\n' + dicom_reader.ocr_frames(source, ds, ocr_page)
+            return text
+    except (Saturated, DeadlineExceeded):
+        raise
     except Exception as e:
         logger.error(f'Text extraction failed: {e}')
+        count_failure('extraction_error')
     return ''
 
-def analyze_content(file_path, gender="male"):
-    try:
-        extension = os.path.splitext(file_path)[1].lower()
-        raw_text = extract_text(file_path, extension)
-        if not raw_text:
-            return {'error': 'No content'}, 400
+def iter_pdf_pages(pdf):
+    """
+    Yield the text of each PDF page in order, OCR-ing scanned pages
+    in-process. Stops early, marking the result partial, when the time
+    budget runs out.
+    """
+    for page_no, page in enumerate(pdf.pages):
+        if expired():
+            budget_spent(f'read {page_no} of {len(pdf.pages)} PDF pages')
+            return
+        with stage('pdf_text'):
+            page_text = page.extract_text() or ''
+        if not page_text:
+            try:
+                with stage('ocr'):
+                    page_text = ocr_image(page.to_image().original)
+            except DeadlineExceeded:
+                budget_spent(f'read {page_no} of {len(pdf.pages)} PDF pages')
+                return
+        yield page_text
+
+def iter_page_texts(source, extension):
+    """Yield report text page by page; images and DICOM files are one page."""
+    if extension == '.pdf':
+        with load('pdfplumber').open(source) as pdf:
+            yield from iter_pdf_pages(pdf)
+    else:
+        yield extract_text(source, extension)
 
+def stream_pdf_text(pdf):
+    """
+    Read PDF pages in order, OCR-ing scanned ones in-process, and feed the
+    text so far to extract_entities after each page. Later pages are never
+    read once PDF_TARGET_ANALYTES are all found or PDF_PAGE_BUDGET is spent.
+    """
+    page_texts = []
+    for page_text in iter_pdf_pages(pdf):
+        page_texts.append(page_text)
+        if PDF_PAGE_BUDGET and len(page_texts) >= PDF_PAGE_BUDGET:
+            break
+        if PDF_TARGET_ANALYTES and PDF_TARGET_ANALYTES <= extract_entities('\n'.join(page_texts)).keys():
+            break
+    skipped = len(pdf.pages) - len(page_texts)
+    if skipped:
+        logger.info(f'Stopped PDF extraction after {len(page_texts)} pages, skipping {skipped}')
+    return '\n'.join(page_texts)
+
+def extract_results(source, extension):
+    """Extract text and analytes from one report. Returns (results, error)."""
+    raw_text = extract_text(source, extension)
+    if not raw_text:
+        if expired():
+            raise DeadlineExceeded('No text extracted within the request time budget')
+        count_failure('no_content')
+        return None, 'No content'
+    with stage('extract_entities'):
         results = extract_entities(raw_text)
-        if not results:
-            return {'error': 'No results'}, 400
+    if not results:
+        if expired():
+            raise DeadlineExceeded('No results extracted within the request time budget')
+        count_failure('no_results')
+        return None, 'No results'
+    return results, None
+
+def analyze_content(source, gender="male", extension=None):
+    try:
+        if extension is None:
+            extension = os.path.splitext(source)[1].lower()
+        results, error = extract_results(source, extension)
+        if error:
+            return {'error': error}, 400
 
-        recommendations = analyze_and_recommend(results, gender=gender)
-        return {
-            'recommendations': recommendations
-        }, 200
+        with stage('recommendation'):
+            recommendations = analyze_and_recommend(results, gender=gender)
+        data = {'recommendations': recommendations}
+        if is_partial():
+            data['partial'] = True
+        return data, 200
+    except (Saturated, DeadlineExceeded):
+        raise
     except Exception:
         logger.error(f'Analyze failed: {traceback.format_exc()}')
+        count_failure('analyze_error')
         return {'error': 'Analyze error'}, 500
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def request_cid():
+    return g.get('cid') or str(uuid.uuid4())
+
 @app.route('/api/analyze', methods=['POST'])
+@profiled(request_cid)
+@limited
 def analyze_file():
-    cid = str(uuid.uuid4())
+    cid = g.cid = str(uuid.uuid4())
     logger.info(f'[{cid}] Start analysis')
 
     if 'file' not in request.files:
         logger.warning(f'[{cid}] No file part in request')
+        count_failure('no_file')
         return jsonify({'error': 'No file'}), 400
 
     file = request.files['file']
     if not file.filename or not allowed_file(file.filename):
         logger.warning(f'[{cid}] Invalid file')
+        count_failure('invalid_file')
         return jsonify({'error': 'Invalid file'}), 400
 
-    extension = os.path.splitext(file.filename)[1]
-    temp_path = os.path.join(UPLOAD_DIR, f"{cid}{extension}")
-    file.save(temp_path)
+    extension = os.path.splitext(file.filename)[1].lower()
+    count_file(extension)
+    validate_upload(file.stream, extension)
+    gender = request.form.get('gender', 'male').lower()
+    content = file.read()
+
+    run_async = request.values.get('async', '').lower() in {'1', 'true', 'yes'}
+
+    cache_key = make_key(content, extension=extension, gender=gender)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        logger.info(f'[{cid}] Analysis served from cache')
+        body = {'status': 'ok', 'cid': cid, 'data': cached}
+        if run_async:
+            return job_accepted(job_queue.add_finished(body), cid)
+        return jsonify(body), 200
+
+    source, spill_path = upload_source(content, f"{cid}{extension}")
+    if run_async:
+        try:
+            job_id = job_queue.submit(analysis_job, cid, cache_key, source, spill_path, gender, extension)
+        except QueueFull:
+            if spill_path:
+                os.remove(spill_path)
+            logger.warning(f'[{cid}] Job queue full')
+            count_failure('queue_full')
+            return jsonify({'error': 'Server busy, retry later'}), 503
+        logger.info(f'[{cid}] Queued as job {job_id}')
+        return job_accepted(job_id, cid)
+
+    body, status = run_analysis(cid, cache_key, source, spill_path, gender, extension)
+    return jsonify(body), status
+
+@app.route('/api/analyze/stream', methods=['POST'])
+def analyze_stream():
+    """
+    Streaming variant of /api/analyze. Responds with NDJSON events: start,
+    one page event per page with the analytes first found on it, one
+    finding event per abnormal result, then done (or error).
+    """
+    cid = g.cid = str(uuid.uuid4())
+    logger.info(f'[{cid}] Start streaming analysis')
+
+    file = request.files.get('file')
+    if file is None or not file.filename or not allowed_file(file.filename):
+        logger.warning(f'[{cid}] Invalid file')
+        count_failure('invalid_file')
+        return jsonify({'error': 'Invalid file'}), 400
+
+    extension = os.path.splitext(file.filename)[1].lower()
+    count_file(extension)
+    validate_upload(file.stream, extension)
+    gender = request.form.get('gender', 'male').lower()
+    content = file.read()
+    cache_key = make_key(content, extension=extension, gender=gender)
+    if result_cache.get(cache_key) is None:
+        # Admission happens here, while a 503 with Retry-After can still be
+        # sent; once the 200 has gone out, saturation is only a body event
+        admit()
+    source, spill_path = upload_source(content, f"{cid}{extension}")
+    # Profiled as it is consumed: the work runs after this view returns
+    events = profiled_stream(stream_analysis(cid, cache_key, source, spill_path, gender, extension), cid)
+    response = Response(stream_with_context(events), mimetype='application/x-ndjson')
+    response.headers['X-Accel-Buffering'] = 'no'  # let reverse proxies pass events through
+    return response
+
+def stream_analysis(cid, cache_key, source, spill_path, gender, extension):
+    def event(name, **fields):
+        return json.dumps({'event': name, **fields}) + '\n'
+
+    try:
+        yield event('start', cid=cid)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f'[{cid}] Analysis served from cache')
+            yield event('done', status='ok', **cached)
+            return
+
+        # Set here: the generator runs after the view has returned. The
+        # view admitted the request, so its OCR waits for slots.
+        with budget(), admitted(check=False):
+            text, results = '', {}
+            for page_no, page_text in enumerate(iter_page_texts(source, extension), 1):
+                text += page_text + '\n'
+                with stage('extract_entities'):
+                    page_results = extract_entities(text)
+                yield event('page', page=page_no,
+                            results={k: v for k, v in page_results.items() if k not in results})
+                results = page_results
+                if extension == '.pdf' and (
+                        (PDF_PAGE_BUDGET and page_no >= PDF_PAGE_BUDGET) or
+                        (PDF_TARGET_ANALYTES and PDF_TARGET_ANALYTES <= results.keys())):
+                    break
+            if not results:
+                if expired():
+                    raise DeadlineExceeded('No results within the request time budget')
+                count_failure('no_results')
+                yield event('error', error='No results')
+                return
+            partial = is_partial()
+
+        findings = []
+        for finding in iter_findings(results, gender):
+            findings.append(finding)
+            yield event('finding', **finding)
+        data = {'recommendations': render_recommendations(findings)}
+        if partial:
+            data['partial'] = True
+        else:
+            result_cache.put(cache_key, data)
+        logger.info(f'[{cid}] Streaming analysis successful')
+        yield event('done', status='ok', **data)
+    except Saturated:
+        logger.warning(f'[{cid}] Streaming analysis rejected, OCR saturated')
+        count_failure('saturated')
+        yield event('error', error='Server busy, retry later', retry_after=RETRY_AFTER)
+    except DeadlineExceeded as e:
+        logger.warning(f'[{cid}] Streaming analysis timed out: {e}')
+        count_failure('deadline')
+        yield event('error', error='Analysis timed out')
+    except Exception:
+        logger.error(f'[{cid}] Streaming analysis failed: {traceback.format_exc()}')
+        count_failure('analyze_error')
+        yield event('error', error='Analyze error')
+    finally:
+        if spill_path:
+            os.remove(spill_path)
+
+@app.route('/api/analyze/batch', methods=['POST'])
+@profiled(request_cid)
+@limited
+def analyze_batch():
+    cid = g.cid = str(uuid.uuid4())
+    files = [f for f in request.files.getlist('files') if f.filename]
+    logger.info(f'[{cid}] Start batch analysis of {len(files)} files')
+
+    if not files:
+        logger.warning(f'[{cid}] No files in batch request')
+        count_failure('no_file')
+        return jsonify({'error': 'No file'}), 400
+    if len(files) > BATCH_MAX_FILES:
+        logger.warning(f'[{cid}] Batch of {len(files)} files exceeds {BATCH_MAX_FILES}')
+        count_failure('too_many_files')
+        return jsonify({'error': f'Too many files (max {BATCH_MAX_FILES})'}), 400
+    invalid = [f.filename for f in files if not allowed_file(f.filename)]
+    if invalid:
+        logger.warning(f'[{cid}] Invalid files in batch: {invalid}')
+        count_failure('invalid_file')
+        return jsonify({'error': 'Invalid file', 'files': invalid}), 400
+
+    for file in files:
+        try:
+            validate_upload(file.stream, os.path.splitext(file.filename)[1].lower())
+        except UploadRejected as e:
+            raise UploadRejected(f'{file.filename}: {e}', e.status)
 
     gender = request.form.get('gender', 'male').lower()
-    data, status = analyze_content(temp_path, gender)
-    os.remove(temp_path)
+    # A saturated server turns the whole batch away with 503; once admitted,
+    # its files queue for OCR slots instead of failing one by one
+    with admitted():
+        futures = []
+        for i, file in enumerate(files):
+            extension = os.path.splitext(file.filename)[1].lower()
+            count_file(extension)
+            source, spill_path = upload_source(file.read(), f"{cid}-{i}{extension}")
+            # Each file runs in the request's context, so under its time budget
+            futures.append(batch_pool.submit(contextvars.copy_context().run,
+                                             batch_extract, cid, source, spill_path, extension))
+        outcomes = [future.result() for future in futures]
+
+    # Merge in upload order; the first file reporting an analyte wins
+    per_file, merged = [], {}
+    for file, (results, error) in zip(files, outcomes):
+        if error:
+            per_file.append({'filename': file.filename, 'status': 'error', 'error': error})
+            continue
+        per_file.append({'filename': file.filename, 'status': 'ok', 'results': results})
+        for test_key, value in results.items():
+            merged.setdefault(test_key, value)
+
+    if not merged:
+        logger.warning(f'[{cid}] Batch produced no results')
+        return jsonify({'error': 'No results', 'files': per_file}), 400
+
+    try:
+        with stage('recommendation'):
+            recommendations = analyze_and_recommend(merged, gender=gender)
+    except Exception:
+        logger.error(f'[{cid}] Batch analyze failed: {traceback.format_exc()}')
+        count_failure('analyze_error')
+        return jsonify({'error': 'Analyze error', 'files': per_file}), 500
+
+    logger.info(f'[{cid}] Batch analysis successful')
+    return jsonify({
+        'status': 'ok',
+        'cid': cid,
+        'files': per_file,
+        'data': {'results': merged, 'recommendations': recommendations,
+                 **({'partial': True} if is_partial() else {})},
+    }), 200
+
+def batch_extract(cid, source, spill_path, extension):
+    try:
+        return extract_results(source, extension)
+    except DeadlineExceeded:
+        logger.warning(f'[{cid}] Batch extraction timed out')
+        count_failure('deadline')
+        return None, 'Timed out'
+    except Saturated:
+        # Fails the whole batch with 503 and Retry-After, not just this file
+        raise
+    except Exception:
+        logger.error(f'[{cid}] Batch extraction failed: {traceback.format_exc()}')
+        count_failure('analyze_error')
+        return None, 'Analyze error'
+    finally:
+        if spill_path:
+            os.remove(spill_path)
+
+def run_analysis(cid, cache_key, source, spill_path, gender, extension):
+    try:
+        data, status = analyze_content(source, gender, extension)
+    finally:
+        if spill_path:
+            os.remove(spill_path)
 
     if status == 200:
+        # Partial results are not cached, so a retry can finish the report
+        if not data.get('partial'):
+            result_cache.put(cache_key, data)
         logger.info(f'[{cid}] Analysis successful')
-        return jsonify({'status': 'ok', 'cid': cid, 'data': data}), 200
+        return {'status': 'ok', 'cid': cid, 'data': data}, 200
 
     logger.warning(f'[{cid}] Analysis failed with status {status}')
-    return jsonify(data), status
+    return data, status
+
+def analysis_job(*args):
+    # Jobs keep the same body the synchronous endpoint would have returned,
+    # under a time budget of their own; args[0] is the request's cid
+    with budget(), correlation(args[0]):
+        body, status = run_analysis(*args)
+    if status != 200:
+        raise JobFailed(body.get('error', f'HTTP {status}'), body)
+    return body
+
+def job_accepted(job_id, cid):
+    response = jsonify({'status': 'queued', 'cid': cid, 'job_id': job_id})
+    response.headers['Location'] = f'/jobs/{job_id}'
+    return response, 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify({
+        'job_id': job['id'],
+        'status': job['status'],
+        'result': job['result'],
+        'error': job['error'],
+    })
 
 @app.route('/health')
 def health():
     return jsonify({'status': 'healthy'})
 
+@app.route('/ready')
+def readiness():
+    return jsonify(report()), 200 if ready.is_set() else 503
+
+def warm_up():
+    return start_warmup([
+        ('imports', lambda: [load(name) for name in HEAVY_MODULES]),
+        ('unit_table', get_conversion_table),
+        ('reference_table', get_reference_table),
+        ('ocr_backend', lambda: get_backend().warm()),
+    ])
+
+if WARMUP_ON_START and SERVICE_PROCESS:
+    warm_up()
+else:
+    ready.set()
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/metrics')
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5002)
@@ -0,0 +1,113 @@
+import os
+import math
+import threading
+import contextvars
+from contextlib import contextmanager
+from flask import has_request_context
+from deadline import DeadlineExceeded, remaining
+
+
+def available_cpus():
+    """CPUs this container may use: the cgroup CPU quota if set, else the affinity mask."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:  # cgroup v2: "<quota> <period>" or "max <period>"
+            quota, period = f.read().split()[:2]
+        quota = None if quota == 'max' else int(quota)
+    except (OSError, ValueError):
+        try:  # cgroup v1
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+                quota = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                period = f.read()
+            quota = None if quota <= 0 else quota
+        except (OSError, ValueError):
+            quota = None
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota / int(period))))
+    return cpus
+
+
+# Concurrent OCR calls per process. The gunicorn config divides the cores
+# between workers; a bare `python app.py` gets them all.
+OCR_CONCURRENCY = int(os.environ.get('OCR_CONCURRENCY', 0)) or available_cpus()
+# How long a request waits for an OCR slot before it is rejected with 503
+OCR_SLOT_WAIT = float(os.environ.get('OCR_SLOT_WAIT', 1.0))
+# Retry-After sent with those 503s, in seconds
+RETRY_AFTER = int(os.environ.get('RETRY_AFTER', 5))
+
+_ocr_slots = threading.BoundedSemaphore(OCR_CONCURRENCY)
+# Set inside admitted(): OCR waits are bounded only by the time budget
+_admitted = contextvars.ContextVar('ocr_admitted', default=False)
+
+
+class Saturated(Exception):
+    """No OCR capacity is free; the request should be retried later."""
+
+
+@contextmanager
+def ocr_slot():
+    """
+    Hold one of the process's OCR slots. Request threads give up after
+    OCR_SLOT_WAIT and raise Saturated; background jobs and admitted work
+    wait their turn.
+    Nobody waits past the end of their time budget (DeadlineExceeded).
+    """
+    timeout = OCR_SLOT_WAIT if has_request_context() and not _admitted.get() else None
+    left = remaining()
+    if left is not None and (timeout is None or left < timeout):
+        # The request's budget runs out before the usual wait would
+        if not _ocr_slots.acquire(timeout=left):
+            raise DeadlineExceeded('Request time budget exhausted waiting for OCR')
+    elif not _ocr_slots.acquire(timeout=timeout):
+        raise Saturated('OCR capacity exhausted')
+    try:
+        yield
+    finally:
+        _ocr_slots.release()
+
+
+@contextmanager
+def spare_ocr_slots(n):
+    """
+    Hold up to n more OCR slots, as many as are free right now, without
+    waiting; yields how many were taken. For work that fans out to other
+    processes, so each of them runs under a slot of this one.
+    """
+    taken = 0
+    while taken < n and _ocr_slots.acquire(blocking=False):
+        taken += 1
+    try:
+        yield taken
+    finally:
+        for _ in range(taken):
+            _ocr_slots.release()
+
+
+def admit():
+    """
+    Admission check for a request about to OCR: returns once an OCR slot is
+    free within OCR_SLOT_WAIT, raises Saturated otherwise. The slot is not
+    kept.
+    """
+    with ocr_slot():
+        pass
+
+
+@contextmanager
+def admitted(check=True):
+    """
+    Admit a request that fans out to several OCR calls (e.g. a batch): it
+    must find a free slot within OCR_SLOT_WAIT like any request (Saturated
+    otherwise), after which the work inside, including threads running a
+    copy of this context, waits for slots like a background job. With
+    check=False the caller has already run admit(), e.g. a streaming view
+    whose work runs after it has returned.
+    """
+    if check:
+        admit()
+    token = _admitted.set(True)
+    try:
+        yield
+    finally:
+        _admitted.reset(token)
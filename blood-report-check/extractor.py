@@ -1,20 +1,9 @@
 import re
 import logging
+from analytes import get_index
 
 logger = logging.getLogger('BloodAnalysis')
 
-BLOOD_TESTS = [
-    "hemoglobin", "hb", "hgb", "hematocrit", "hct", "rbc", "red blood cell",
-    "wbc", "white blood cell", "platelet", "platelets", "neutrophils",
-    "lymphocytes", "eosinophils", "monocytes", "basophils", "fasting plasma glucose",
-    "2-hour postprandial glucose", "glucose", "hba1c", "total cholesterol",
-    "ldl cholesterol", "hdl cholesterol", "triglycerides", "total bilirubin",
-    "alt", "sgpt", "ast", "sgot", "alp", "albumin", "serum creatinine",
-    "creatinine", "bun", "blood urea nitrogen", "egfr", "sodium", "tsh",
-    "free t4", "total t3", "serum iron", "iron", "ferritin", "tibc",
-    "troponin-i", "ck-mb", "bnp", "crp", "esr", "pt", "inr", "aptt", "mch", "mchc"
-]
-
 SKIP_WORDS = ["reference", "range", "unit", "normal", "interval", "ref.",
              "biological", "test", "parameter", "result", "value"]
 
@@ -25,13 +14,8 @@ EXPECTED_RANGES = {
 }
 
 # Precompiled regex patterns
-TEST_PATTERN = re.compile(r'\b(' + '|'.join(map(re.escape, BLOOD_TESTS)) + r')\b')
 SKIP_RE = re.compile(r'\b(' + '|'.join(map(re.escape, SKIP_WORDS)) + r')\b')
 VALUE_UNIT_RE = re.compile(r'(\d+[\.,]?\d*)\s*([a-zA-Z%/µ²³\-]*)')
-NORMALIZE_RE = re.compile(r'[^a-z0-9]')
-
-# Precomputed mappings
-TEST_TO_KEY = {test: NORMALIZE_RE.sub('', test) for test in BLOOD_TESTS}
 
 def clean_lines(text):
     return [re.sub(r'\s+', ' ', line.strip()).lower()
@@ -51,21 +35,19 @@ def correct_value(test_key, value):
 
 def extract_entities(text):
     results = {}
+    index = get_index()
     lines = clean_lines(text)
 
     for i, line in enumerate(lines):
         if SKIP_RE.search(line):
             continue
 
-        for match in TEST_PATTERN.finditer(line):
-            test_name = match.group()
-            test_key = TEST_TO_KEY[test_name]
-
+        for test_key, _, end in index.finditer(line):
             if test_key in results:
                 continue
 
             # Look in current line first
-            value_match = VALUE_UNIT_RE.search(line[match.end():])
+            value_match = VALUE_UNIT_RE.search(line[end:])
             if value_match:
                 value, unit = value_match.groups()
                 results[test_key] = {
@@ -91,3 +73,15 @@ def extract_entities(text):
         logger.warning("No results extracted. Check OCR quality.")
 
     return results
+
+def analyte_hit_rate(text):
+    """
+    Share of the analytes named in text for which extract_entities reads a
+    value; low when OCR garbled the numbers. 0.0 if no analyte is named.
+    """
+    index = get_index()
+    named = {key for line in clean_lines(text) if not SKIP_RE.search(line)
+             for key, _, _ in index.finditer(line)}
+    if not named:
+        return 0.0
+    return len(named & extract_entities(text).keys()) / len(named)
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import logging
+import threading
+import traceback
+from contextlib import closing
+
+logger = logging.getLogger('common.jobs')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+)
+"""
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobFailed(Exception):
+    """
+    Raised by a job that ran but did not succeed: the job is recorded as
+    'failed' with this error, keeping `result` (e.g. the error body) too.
+    """
+
+    def __init__(self, error, result=None):
+        super().__init__(error)
+        self.result = result
+
+
+class JobQueue:
+    """
+    Job queue drained by a bounded pool of worker threads in this process.
+    Job state lives in a SQLite file at `path`, on node-local disk, so any
+    server worker process sharing it can answer a poll, whichever one
+    accepted the job. Finished jobs are kept for `retention` seconds;
+    unfinished ones left by a worker that died are dropped after the same
+    time. Expired rows are deleted when jobs are added, not on polls.
+    """
+
+    def __init__(self, path, workers=2, max_queue=32, retention=900):
+        self.path = path
+        self.workers = workers
+        self.retention = retention
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._threads = []
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as db:
+            # WAL lets polls read while another process writes
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(SCHEMA)
+
+    def submit(self, fn, *args, **kwargs):
+        """Enqueue fn(*args, **kwargs) and return its job id; raises QueueFull."""
+        self._ensure_workers()
+        job_id = self._new_job('queued')
+        try:
+            self._queue.put_nowait((job_id, fn, args, kwargs))
+        except queue.Full:
+            self._execute('DELETE FROM jobs WHERE id = ?', job_id)
+            raise QueueFull('Job queue is full')
+        return job_id
+
+    def add_finished(self, result):
+        """Record an already-available result (e.g. a cache hit) as a done job."""
+        return self._new_job('done', json.dumps(result))
+
+    def get(self, job_id):
+        with self._connect() as db:
+            db.row_factory = sqlite3.Row
+            # Rows past retention may not be pruned yet; they count as gone
+            row = db.execute('SELECT * FROM jobs WHERE id = ? AND COALESCE(finished_at, submitted_at) >= ?',
+                             (job_id, time.time() - self.retention)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        return job
+
+    def stats(self):
+        with self._connect() as db:
+            counts = dict(db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        return {
+            'queued': self._queue.qsize(),
+            'running': counts.get('running', 0),
+            'retained': sum(counts.values()),
+            'workers': len(self._threads),
+        }
+
+    def _connect(self):
+        # A connection per call: cheap next to an analysis, and safe to use
+        # from any thread; closing() because sqlite3's own context manager
+        # only commits
+        return closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    def _execute(self, sql, *params):
+        with self._connect() as db:
+            db.execute(sql, params)
+
+    def _new_job(self, status, result=None):
+        self._prune()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute('INSERT INTO jobs (id, status, submitted_at, finished_at, result) '
+                      'VALUES (?, ?, ?, ?, ?)',
+                      job_id, status, now, now if status == 'done' else None, result)
+        return job_id
+
+    def _ensure_workers(self):
+        # Threads start on first use so forked server workers each get their own
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def _run(self):
+        while True:
+            job_id, fn, args, kwargs = self._queue.get()
+            self._execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?",
+                          time.time(), job_id)
+            try:
+                result, error, status = json.dumps(fn(*args, **kwargs)), None, 'done'
+            except JobFailed as e:
+                logger.warning(f'Job {job_id} failed: {e}')
+                result, error, status = json.dumps(e.result), str(e), 'failed'
+            except Exception as e:
+                logger.error(f'Job {job_id} failed: {traceback.format_exc()}')
+                result, error, status = None, str(e), 'failed'
+            self._execute('UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? '
+                          'WHERE id = ?', status, result, error, time.time(), job_id)
+            self._queue.task_done()
+
+    def _prune(self):
+        self._execute('DELETE FROM jobs WHERE COALESCE(finished_at, submitted_at) < ?',
+                      time.time() - self.retention)
@@ -0,0 +1,152 @@
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from flask import g, has_app_context, has_request_context, request
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+# Where the JSON lines go. Rotation is per process, so only one process may
+# own a file: 'file' is the single-process default; 'pid-file' appends the
+# pid to the file name (process pools, e.g. reprocess.py); 'stdout' leaves
+# collection and rotation to the platform (set by gunicorn.conf.py).
+LOG_DEST = os.environ.get('LOG_DEST', 'file')
+# Parent of the loggers in the modules both services share (jobs, profiling,
+# dicom_reader); setup_logging sends them to the service's destination too
+COMMON_LOGGER = 'common'
+# Fraction of per-analyte DEBUG lines that are written (1 = all of them)
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', 0.01))
+
+_cid = contextvars.ContextVar('cid', default=None)
+
+
+@contextmanager
+def correlation(cid):
+    """Tag every record logged by the enclosed work with cid."""
+    token = _cid.set(cid)
+    try:
+        yield
+    finally:
+        _cid.reset(token)
+
+
+def current_cid():
+    """The correlation id of the work in progress, or '-' outside of one."""
+    cid = _cid.get()
+    if cid:
+        return cid
+    if has_request_context() and getattr(request, 'cid', None):
+        return request.cid
+    if has_app_context() and g.get('cid'):
+        return g.cid
+    return '-'
+
+
+def sampled(rate=LOG_SAMPLE_RATE):
+    """True for roughly rate of calls; gates high-volume DEBUG lines."""
+    return rate >= 1 or random.random() < rate
+
+
+class CorrelationFilter(logging.Filter):
+    """Gives records logged without a cid (or with '-') the current one."""
+
+    def filter(self, record):
+        if getattr(record, 'cid', '-') == '-':
+            record.cid = current_cid()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, cid and message."""
+
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'cid': getattr(record, 'cid', '-'),
+            'msg': record.getMessage(),
+        }
+        # Queued records carry their traceback pre-rendered (see _QueueHandler)
+        exc = self.formatException(record.exc_info) if record.exc_info else getattr(record, 'exc', None)
+        if exc:
+            entry['exc'] = exc
+        return json.dumps(entry, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Merge args and render any traceback on the calling thread, as the
+        # base class does, but keep the traceback out of the message so the
+        # JSON formatter can put it in its own field
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc = self.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _JsonFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler for the listener thread. It tracks the file size
+    itself rather than stat-ing and seeking before every record (which also
+    flushes), and flushes once the queue is drained, so a burst of records
+    costs one write.
+    """
+
+    def __init__(self, log_queue, path, max_bytes, backup_count):
+        super().__init__(path, maxBytes=max_bytes, backupCount=backup_count)
+        self._queue = log_queue
+        self.stream.seek(0, 2)
+        self._size = self.stream.tell()
+
+    def emit(self, record):
+        try:
+            # JSON output is ASCII, so characters are bytes
+            line = self.format(record) + '\n'
+            if self.maxBytes and self._size + len(line) > self.maxBytes:
+                self.doRollover()
+                self._size = 0
+            self.stream.write(line)
+            self._size += len(line)
+            if self._queue.empty():
+                self.stream.flush()
+        except Exception:
+            self.handleError(record)
+
+
+def setup_logging(logger, path, max_bytes, backup_count):
+    """
+    Send logger's and COMMON_LOGGER's records, as JSON lines, through a queue to the LOG_DEST
+    (path rotated at max_bytes, or stdout). The calling thread only formats
+    the message and enqueues it; a background listener thread does the
+    writes and rotation. Returns the listener, which is stopped (and
+    flushed) at exit.
+    """
+    log_queue = queue.SimpleQueue()
+    if LOG_DEST == 'stdout':
+        out_handler = logging.StreamHandler(sys.stdout)
+    else:
+        if LOG_DEST == 'pid-file':
+            root, ext = os.path.splitext(path)
+            path = f'{root}.{os.getpid()}{ext}'
+        out_handler = _JsonFileHandler(log_queue, path, max_bytes, backup_count)
+    out_handler.setFormatter(JsonFormatter())
+    handler = _QueueHandler(log_queue)
+    handler.setFormatter(logging.Formatter())
+    handler.addFilter(CorrelationFilter())
+    listener = QueueListener(log_queue, out_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    for target in (logger, logging.getLogger(COMMON_LOGGER)):
+        target.setLevel(LOG_LEVEL)
+        target.addHandler(handler)
+    return listener
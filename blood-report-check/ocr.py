@@ -0,0 +1,299 @@
+import io
+import os
+import re
+import queue
+import logging
+import threading
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from startup import load
+from concurrency import OCR_CONCURRENCY, ocr_slot, spare_ocr_slots
+from deadline import DeadlineExceeded, budget, check, remaining
+
+logger = logging.getLogger('BloodAnalysis')
+
+# 'auto' prefers the in-process tesserocr engine and falls back to pytesseract
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'auto')
+OCR_LANG = os.environ.get('OCR_LANG', 'eng')
+DEFAULT_CONFIG = '--psm 11'
+PSM_RE = re.compile(r'--psm\s+(\d+)')
+
+# One recognised word: mean confidence 0-100 and its pixel box
+OcrWord = namedtuple('OcrWord', ['text', 'conf', 'left', 'top', 'right', 'bottom'])
+
+_backend = None
+_backend_lock = threading.Lock()
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+
+class PytesseractBackend:
+    """Runs the tesseract binary per call; language data is reloaded every time."""
+
+    name = 'pytesseract'
+
+    def __init__(self, lang=OCR_LANG):
+        self.lang = lang
+
+    def warm(self, engines=1):
+        pass
+
+    def _run(self, method, image, config, **kwargs):
+        # pytesseract kills the tesseract process once timeout expires
+        try:
+            return getattr(load('pytesseract'), method)(
+                image, lang=self.lang, config=config, timeout=tesseract_timeout(), **kwargs)
+        except RuntimeError as e:
+            if 'timeout' in str(e).lower():
+                raise DeadlineExceeded('OCR stopped: request time budget exhausted') from e
+            raise
+
+    def image_to_string(self, image, config=''):
+        return self._run('image_to_string', image, config)
+
+    def image_to_data(self, image, config=''):
+        data = self._run('image_to_data', image, config, output_type=load('pytesseract').Output.DICT)
+        return [OcrWord(text, float(conf), left, top, left + width, top + height)
+                for text, conf, left, top, width, height in zip(
+                    data['text'], data['conf'], data['left'], data['top'], data['width'], data['height'])
+                if text.strip() and float(conf) >= 0]
+
+
+class TesserocrBackend:
+    """
+    Keeps pre-initialised tesseract engines in-process and reuses them across
+    requests. Engines are pooled rather than bound to threads, since the
+    development server starts a new thread per request.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, lang=OCR_LANG):
+        self.lang = lang
+        self._tesserocr = load('tesserocr')
+        self._idle = queue.LifoQueue()
+        # Fail fast (RuntimeError) if the language data cannot be loaded
+        self._idle.put(self._new_engine())
+
+    def _new_engine(self):
+        return self._tesserocr.PyTessBaseAPI(lang=self.lang)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._new_engine()
+
+    def warm(self, engines=1):
+        for api in [self._acquire() for _ in range(engines)]:
+            self._idle.put(api)
+
+    def _psm(self, config):
+        m = PSM_RE.search(config)
+        return int(m.group(1)) if m else self._tesserocr.PSM.AUTO
+
+    def _recognize(self, api):
+        # Recognition is cancelled in-process once the timeout (ms) passes
+        timeout = tesseract_timeout()
+        if not api.Recognize(int(timeout * 1000)):
+            raise DeadlineExceeded('OCR stopped: request time budget exhausted')
+
+    def image_to_string(self, image, config=''):
+        api = self._acquire()
+        try:
+            api.SetPageSegMode(self._psm(config))
+            api.SetImage(image)
+            self._recognize(api)
+            return api.GetUTF8Text()
+        finally:
+            self._idle.put(api)
+
+    def image_to_data(self, image, config=''):
+        level = self._tesserocr.RIL.WORD
+        api = self._acquire()
+        try:
+            api.SetPageSegMode(self._psm(config))
+            api.SetImage(image)
+            self._recognize(api)
+            iterator = api.GetIterator()
+            if iterator is None:
+                return []
+            words = []
+            for word in self._tesserocr.iterate_level(iterator, level):
+                text = word.GetUTF8Text(level)
+                if text and text.strip():
+                    words.append(OcrWord(text, word.Confidence(level), *word.BoundingBox(level)))
+            return words
+        finally:
+            self._idle.put(api)
+
+
+def tesseract_timeout():
+    """Seconds a tesseract call may run under the current budget (0 = no limit)."""
+    left = remaining()
+    if left is None:
+        return 0
+    if left <= 0:
+        raise DeadlineExceeded('Request time budget exhausted before OCR')
+    return left
+
+
+def create_backend(name=OCR_BACKEND, lang=OCR_LANG):
+    # tesserocr is in requirements.txt; running without it works but is slower
+    if name in {'auto', 'tesserocr'}:
+        try:
+            return TesserocrBackend(lang)
+        except ImportError:
+            logger.warning('tesserocr is not installed, falling back to pytesseract')
+        except RuntimeError as e:
+            logger.warning(f'tesserocr init failed, falling back to pytesseract: {e}')
+    return PytesseractBackend(lang)
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+            logger.info(f'OCR backend: {_backend.name}')
+        return _backend
+
+
+def ocr_image(image, config=DEFAULT_CONFIG):
+    with ocr_slot():
+        return get_backend().image_to_string(image, config)
+
+
+def ocr_words(image, config=DEFAULT_CONFIG):
+    """OCR an image into OcrWords: text with confidence and position."""
+    with ocr_slot():
+        return get_backend().image_to_data(image, config)
+
+
+def group_rows(words):
+    """
+    Cluster OcrWords into text rows, top to bottom: a word whose vertical
+    centre falls inside the current row joins it. Returns [top, bottom, text].
+    """
+    rows = []
+    for word in sorted(words, key=lambda w: w.top + w.bottom):
+        centre = (word.top + word.bottom) / 2
+        if rows and rows[-1][0] <= centre <= rows[-1][1]:
+            row = rows[-1]
+            row[0], row[1] = min(row[0], word.top), max(row[1], word.bottom)
+            row[2].append(word)
+        else:
+            rows.append([word.top, word.bottom, [word]])
+    return [[top, bottom, ' '.join(w.text for w in sorted(row, key=lambda w: w.left))]
+            for top, bottom, row in rows]
+
+
+def words_to_text(words):
+    """Text of OcrWords, one line per row."""
+    return '\n'.join(text for _, _, text in group_rows(words))
+
+
+def _ocr_pdf_chunk(source, page_numbers, config):
+    # Runs inside a pool worker: open the PDF once and OCR a run of pages,
+    # stopping when the time budget runs out. Returns {page number: text}.
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    texts = {}
+    with load('pdfplumber').open(source) as pdf:
+        for n in page_numbers:
+            try:
+                check()
+                texts[n] = ocr_image(pdf.pages[n].to_image().original, config)
+            except DeadlineExceeded:
+                break
+    return texts
+
+
+def _ocr_pdf_chunk_in_budget(seconds, *args):
+    # Pool workers get whatever was left of the request's budget (0 = none)
+    with budget(seconds):
+        return _ocr_pdf_chunk(*args)
+
+
+def get_page_pool(workers):
+    """
+    Lazily create the process pool used for page-parallel OCR. Workers are
+    spawned rather than forked so they never inherit Flask's threads/locks;
+    each one keeps its own OCR backend alive between tasks.
+    """
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _page_pool
+
+
+def _drop_page_pool():
+    global _page_pool
+    with _page_pool_lock:
+        pool, _page_pool = _page_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def ocr_pdf_pages(source, page_numbers, workers, config=DEFAULT_CONFIG):
+    """
+    OCR the given pages of a PDF across a process pool, returning
+    {page number: text}. Pages the time budget did not leave room for are
+    missing from it; chunks that finished in time are kept. `source` must be
+    picklable: a path or the PDF bytes.
+    """
+    page_numbers = list(page_numbers)
+    if not page_numbers:
+        return {}
+    # Every pool process running a chunk holds one of this process's OCR
+    # slots, so workers x pool processes never exceed the cores gunicorn
+    # split through OCR_CONCURRENCY
+    workers = min(workers, OCR_CONCURRENCY)
+    try:
+        with ocr_slot(), spare_ocr_slots(min(workers, len(page_numbers)) - 1) as spare:
+            n_chunks = 1 + spare
+            if n_chunks > 1:
+                return _ocr_pdf_chunks(source, page_numbers, n_chunks, workers, config)
+    except BrokenProcessPool as e:
+        # A pool process died (e.g. OOM): the next request gets a new pool
+        logger.warning(f'Page OCR pool broke, OCR-ing in-process: {e}')
+        _drop_page_pool()
+    # Only one slot free (or no pool): OCR in-process, page by page
+    return _ocr_pdf_chunk(source, page_numbers, config)
+
+
+def _ocr_pdf_chunks(source, page_numbers, n_chunks, workers, config):
+    # Contiguous chunks so each worker parses the PDF only once
+    size, extra = divmod(len(page_numbers), n_chunks)
+    chunks, start = [], 0
+    for i in range(n_chunks):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(page_numbers[start:end])
+        start = end
+
+    # budget(0) means no deadline, so only a missing budget maps to 0; one
+    # that has run out stops here instead of sending unbounded chunks
+    seconds = remaining()
+    if seconds == 0.0:
+        raise DeadlineExceeded('Request time budget exhausted before page OCR')
+    pool = get_page_pool(workers)
+    seconds = 0 if seconds is None else seconds
+    futures = [pool.submit(_ocr_pdf_chunk_in_budget, seconds, source, chunk, config) for chunk in chunks]
+    texts = {}
+    try:
+        for future in futures:
+            texts.update(future.result(timeout=remaining()))
+    except FutureTimeout:
+        # Keep the chunks that did finish, in whatever order they ran
+        for future in futures:
+            if future.done():
+                texts.update(future.result())
+            else:
+                future.cancel()
+    return texts
@@ -0,0 +1,96 @@
+import os
+import time
+import logging
+import cProfile
+import functools
+import threading
+from flask import request
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger('common.profiling')
+
+# Requests sent with "X-Profile: 1" run under cProfile when PROFILE_REQUESTS=1;
+# the stats are written to PROFILE_DIR/<cid>.prof (inspect with pstats/snakeviz)
+PROFILE_REQUESTS = os.environ.get('PROFILE_REQUESTS', '0') == '1'
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(__file__), 'uploads', 'profiles'))
+PROFILE_HEADER = 'X-Profile'
+
+# One profiled request at a time: concurrent profilers are not supported on
+# newer Pythons and would skew each other's timings anyway
+_profile_lock = threading.Lock()
+
+
+def wants_profile():
+    return PROFILE_REQUESTS and request.headers.get(PROFILE_HEADER) == '1'
+
+
+def profiled(get_cid):
+    """
+    Decorate a view so that opted-in requests are profiled. get_cid() is
+    called after the view returns and names the profile file. Only the
+    request thread is profiled, so async jobs show just the enqueue.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not wants_profile():
+                return view(*args, **kwargs)
+            if not _profile_lock.acquire(blocking=False):
+                logger.warning('Profiling already in progress, running request unprofiled')
+                return view(*args, **kwargs)
+            profiler = cProfile.Profile()
+            start = time.perf_counter()
+            try:
+                return profiler.runcall(view, *args, **kwargs)
+            finally:
+                _profile_lock.release()
+                save_profile(profiler, get_cid(), time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+def profiled_stream(events, cid):
+    """
+    Profile a streamed response's generator while the server consumes it,
+    for views whose work runs after they return; wrap it in place of
+    decorating the view. Time spent between events (sending them) is left
+    out. Opt-in as for profiled().
+    """
+    if not wants_profile():
+        return events
+    return _profile_events(events, cid)
+
+
+def _profile_events(events, cid):
+    # The lock is taken on the first event, so a response that is never
+    # iterated does not hold it
+    if not _profile_lock.acquire(blocking=False):
+        logger.warning('Profiling already in progress, streaming unprofiled', extra={'cid': cid})
+        yield from events
+        return
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    try:
+        while True:
+            profiler.enable()
+            try:
+                item = next(events)
+            except StopIteration:
+                return
+            finally:
+                profiler.disable()
+            yield item
+    finally:
+        events.close()
+        _profile_lock.release()
+        save_profile(profiler, cid, time.perf_counter() - start)
+
+
+def save_profile(profiler, cid, elapsed):
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f'{secure_filename(cid)}.prof')
+        profiler.dump_stats(path)
+        logger.info(f'Profile written to {path} ({elapsed:.2f}s)', extra={'cid': cid})
+    except Exception as e:
+        logger.error(f'Could not write profile: {e}', extra={'cid': cid})
@@ -1,6 +1,8 @@
 import logging
-from reference import REFERENCE
-from units import normalize_unit, convert_value
+from reference import DEFAULT_AGE, get_reference_table, sex_code
+from startup import load
+from logs import sampled
+from units import normalize_unit, conversion_factor
 
 logger = logging.getLogger('BloodAnalysis')
 
@@ -20,47 +22,89 @@ ADVICE = {
     # Add more as needed...
 }
 
-def analyze_and_recommend(results, gender="male"):
-    health_status = "Healthy"
-    abnormal_advice = []
-    gender = gender.lower()
-    abnormal_found = False
+def classify_panels(panels):
+    """
+    Range-check many panels at once. panels is a list of (results, gender,
+    age) with age in years or None; returns one list of findings per panel,
+    holding only the abnormal values. Reference lookup, unit conversion and
+    comparison run over every result of every panel as array operations;
+    messages are rendered for the abnormal rows only.
+    """
+    np = load('numpy')
+    table = get_reference_table()
+    owners, analytes, values, units, sexes, ages = [], [], [], [], [], []
+    for panel, (results, gender, age) in enumerate(panels):
+        for test_key, data in results.items():
+            try:
+                value = float(data["value"])
+            except Exception:
+                logger.error("Could not parse value for %s: %s", test_key, data["value"])
+                continue
+            owners.append(panel)
+            analytes.append(test_key)
+            values.append(value)
+            units.append(normalize_unit(data["unit"]))
+            sexes.append(sex_code(gender))
+            ages.append(DEFAULT_AGE if age is None else age)
 
-    for test_key, data in results.items():
-        ref = REFERENCE.get(test_key)
-        if not ref:
-            logger.warning(f"No reference for {test_key}")
+    findings = [[] for _ in panels]
+    if not analytes:
+        return findings
+    rows = table.lookup(analytes, sexes, ages)
+    factors = np.ones(len(rows))
+    for i, row in enumerate(rows.tolist()):
+        if row < 0:
+            logger.warning("No reference for %s", analytes[i])
             continue
+        ref_unit = table.units[row]
         try:
-            value = float(data["value"])
-        except Exception:
-            logger.error(f"Could not parse value for {test_key}: {data['value']}")
-            continue
-        unit = normalize_unit(data["unit"])
-        ref_range = ref.get(gender, ref.get("male"))
-        low, high = ref_range["range"]
-        ref_unit = normalize_unit(ref_range["unit"])
-        value_converted = convert_value(value, unit, ref_unit, test_key)
-        logger.info(f"Comparing {test_key}: {value_converted} {ref_unit} (ref: {low}-{high} {ref_unit})")
-        if value_converted < low:
-            health_status = "Abnormal"
-            abnormal_found = True
-            msg = f"{test_key.title()} is LOW ({value_converted} {ref_unit}, normal: {low}-{high} {ref_unit})."
-            diet = ADVICE.get(test_key, {}).get("low", "")
-            if diet:
-                msg += " Recommendation: " + diet
-            abnormal_advice.append(msg)
-        elif value_converted > high:
-            health_status = "Abnormal"
-            abnormal_found = True
-            msg = f"{test_key.title()} is HIGH ({value_converted} {ref_unit}, normal: {low}-{high} {ref_unit})."
-            diet = ADVICE.get(test_key, {}).get("high", "")
-            if diet:
-                msg += " Recommendation: " + diet
-            abnormal_advice.append(msg)
-        # If normal, do not display
+            # A missing unit (common with OCR) is taken to be the reference unit
+            factors[i] = conversion_factor(units[i] or ref_unit, ref_unit, analytes[i])
+        except ValueError as e:
+            logger.warning("Skipping %s: %s", analytes[i], e)
+            rows[i] = -1
+    # Python's round, not np.round, so values at a rounding boundary
+    # (e.g. 17.895) are classified the same as before
+    converted = np.array([round(v, 2) for v in (np.array(values) * factors).tolist()])
+    flags = table.classify(rows, converted)
+    logger.info("Compared %d results across %d panel(s), %d abnormal",
+                (rows >= 0).sum(), len(panels), np.count_nonzero(flags))
+    if logger.isEnabledFor(logging.DEBUG):
+        # Per-analyte lines are sampled (LOG_SAMPLE_RATE) so DEBUG stays usable under load
+        for i in np.flatnonzero(rows >= 0).tolist():
+            if sampled():
+                low, high = table.bounds[rows[i]]
+                logger.debug("%s: %s %s against %s-%s, flag %d", analytes[i], converted[i],
+                             table.units[rows[i]], low, high, flags[i])
+
+    for i in np.flatnonzero(flags).tolist():
+        test_key, row = analytes[i], int(rows[i])
+        flag = "high" if flags[i] > 0 else "low"
+        value_converted = float(converted[i])
+        ref_unit = table.units[row]
+        low, high = table.bounds[row]
+        msg = f"{test_key.title()} is {flag.upper()} ({value_converted} {ref_unit}, normal: {low}-{high} {ref_unit})."
+        diet = ADVICE.get(test_key, {}).get(flag, "")
+        if diet:
+            msg += " Recommendation: " + diet
+        findings[owners[i]].append({
+            "test": test_key,
+            "flag": flag,
+            "value": value_converted,
+            "unit": ref_unit,
+            "range": [low, high],
+            "message": msg,
+        })
+    return findings
 
-    if not abnormal_found:
+def iter_findings(results, gender="male", age=None):
+    """Yield a finding dict for every abnormal value in one panel."""
+    yield from classify_panels([(results, gender, age)])[0]
+
+def render_recommendations(findings):
+    if not findings:
         return "Health Status: Healthy\n\nAll your test results are within normal ranges. Keep up your healthy lifestyle!"
-    else:
-        return f"Health Status: Abnormal\n\n" + "\n\n".join(abnormal_advice)
+    return "Health Status: Abnormal\n\n" + "\n\n".join(f["message"] for f in findings)
+
+def analyze_and_recommend(results, gender="male", age=None):
+    return render_recommendations(classify_panels([(results, gender, age)])[0])
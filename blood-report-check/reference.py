@@ -1,3 +1,10 @@
+import os
+import threading
+from startup import load
+from units import normalize_unit
+
+# analyte -> sex -> band, or a list of bands each limited to an age range
+# [min, max) in years; a band without "age" applies at every age
 REFERENCE = {
     "hemoglobin": {
         "male":    {"range": (13.2, 16.6), "unit": "g/dl"},
@@ -13,3 +20,82 @@ REFERENCE = {
     },
     # Add all other tests in this format as needed...
 }
+
+SEXES = ("male", "female")
+# Age used to pick a band when the report does not give one
+DEFAULT_AGE = float(os.environ.get('DEFAULT_AGE', 30))
+# Upper age bound for keying rows; bands ending above it are open-ended
+MAX_AGE = 1000.0
+
+_table = None
+_table_lock = threading.Lock()
+
+
+class ReferenceTable:
+    """
+    REFERENCE compiled into parallel arrays, one row per (analyte, sex, age
+    band), sorted so a whole batch of lookups is a single searchsorted.
+    """
+
+    def __init__(self, reference):
+        np = load('numpy')
+        self.analytes = sorted(reference)
+        self.analyte_ids = {key: i for i, key in enumerate(self.analytes)}
+
+        rows = []
+        for key in self.analytes:
+            for sex_code, sex in enumerate(SEXES):
+                # Sexes without their own ranges use the male ones
+                bands = reference[key].get(sex, reference[key].get("male"))
+                if bands is None:
+                    continue
+                for band in bands if isinstance(bands, list) else [bands]:
+                    age_min, age_max = band.get("age", (0, MAX_AGE))
+                    rows.append((self.analyte_ids[key] * len(SEXES) + sex_code,
+                                 age_min, age_max, band["range"], normalize_unit(band["unit"])))
+        rows.sort(key=lambda row: row[:2])
+
+        self.group = np.array([row[0] for row in rows], dtype=np.int64)
+        self.age_min = np.array([row[1] for row in rows], dtype=np.float64)
+        self.age_max = np.array([row[2] for row in rows], dtype=np.float64)
+        self.low = np.array([row[3][0] for row in rows], dtype=np.float64)
+        self.high = np.array([row[3][1] for row in rows], dtype=np.float64)
+        self._sort_key = self.group * MAX_AGE + self.age_min
+        # Per-row values kept as Python objects, used only when rendering
+        self.bounds = [list(row[3]) for row in rows]
+        self.units = [row[4] for row in rows]
+
+    def lookup(self, analytes, sexes, ages):
+        """
+        Row index of the band for each (analyte, sex, age), or -1 where the
+        analyte is unknown or no band covers the age. sexes are 0 for male and
+        1 for female; ages are in years.
+        """
+        np = load('numpy')
+        ids = np.array([self.analyte_ids.get(a, -1) for a in analytes], dtype=np.int64)
+        ages = np.minimum(np.asarray(ages, dtype=np.float64), MAX_AGE - 1)
+        groups = ids * len(SEXES) + np.asarray(sexes, dtype=np.int64)
+        rows = np.searchsorted(self._sort_key, groups * MAX_AGE + ages, side='right') - 1
+        safe = np.maximum(rows, 0)
+        found = (ids >= 0) & (rows >= 0) & (self.group[safe] == groups) & (ages < self.age_max[safe])
+        return np.where(found, rows, -1)
+
+    def classify(self, rows, values):
+        """-1 below, 0 within and 1 above each row's range; 0 where row is -1."""
+        np = load('numpy')
+        safe = np.maximum(rows, 0)
+        flags = (values > self.high[safe]).astype(np.int8) - (values < self.low[safe])
+        return np.where(rows >= 0, flags, 0)
+
+
+def sex_code(gender):
+    return 1 if (gender or "").lower() == "female" else 0
+
+
+def get_reference_table():
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = ReferenceTable(REFERENCE)
+    return _table
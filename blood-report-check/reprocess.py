@@ -0,0 +1,32 @@
+"""
+Re-run archived blood reports through the analysis pipeline offline.
+
+    python reprocess.py /archive/2023 /archive/2024 --out results.jsonl
+    python reprocess.py --manifest reports.txt --out results.jsonl --workers 8
+
+Each report goes through extract_text -> extract_entities ->
+analyze_and_recommend in a pool of worker processes. Results are appended
+to the JSONL output as they finish, one line per report. The output file is
+also the checkpoint: run the same command again after a crash and reports
+already in it are skipped (--fresh starts over).
+
+Manifest lines are a report path, optionally followed by ",female" or
+",male" (default --gender); relative paths are resolved against the manifest.
+"""
+import os
+import offline
+
+
+def process_report(path, gender):
+    from app import extract_results
+    from recommendation import analyze_and_recommend
+
+    results, error = extract_results(path, os.path.splitext(path)[1].lower())
+    if error:
+        return {'status': 'error', 'error': error}
+    return {'status': 'ok', 'results': results,
+            'recommendations': analyze_and_recommend(results, gender=gender)}
+
+
+if __name__ == '__main__':
+    offline.main(__doc__, process_report, option='gender', choices=['male', 'female'])
@@ -0,0 +1,81 @@
+import os
+import logging
+from startup import load
+from analytes import get_index
+from ocr import ocr_image, ocr_words, group_rows
+from metrics import stage, observe_roi_pixels
+
+logger = logging.getLogger('BloodAnalysis')
+
+# The locate pass reads the page downscaled by this factor; it only needs
+# to recognise analyte names, not digits
+ROI_LOCATE_SCALE = float(os.environ.get('ROI_LOCATE_SCALE', 0.5))
+# Rows after each analyte row that are re-read too, for values printed below the name
+ROI_NEXT_ROWS = int(os.environ.get('ROI_NEXT_ROWS', 1))
+# Vertical padding around each row, as a fraction of its height
+ROW_PAD = 0.35
+# Blank space between rows in the stitched image, so they stay separate lines
+MIN_ROW_GAP = 12
+
+
+def locate_rows(image, scale=ROI_LOCATE_SCALE):
+    """
+    OCR a downscaled copy of the page and return the (top, bottom) pixel
+    bands, at full resolution, of rows naming an analyte plus the
+    ROI_NEXT_ROWS rows after each. Overlapping bands are merged.
+    """
+    width, height = image.size
+    small = image.resize((max(1, round(width * scale)), max(1, round(height * scale))),
+                         load('PIL.Image').BILINEAR)
+    rows = group_rows(ocr_words(small))
+    index = get_index()
+    wanted = set()
+    for i, (_, _, text) in enumerate(rows):
+        if next(index.finditer(text.lower()), None):
+            wanted.update(range(i, min(i + ROI_NEXT_ROWS + 1, len(rows))))
+
+    bands = []
+    for i in sorted(wanted):
+        top, bottom = rows[i][0] / scale, rows[i][1] / scale
+        pad = (bottom - top) * ROW_PAD
+        top, bottom = max(0, int(top - pad)), min(height, int(bottom + pad + 1))
+        if bands and top <= bands[-1][1]:
+            bands[-1][1] = max(bands[-1][1], bottom)
+        else:
+            bands.append([top, bottom])
+    return bands
+
+
+def stitch_rows(image, bands):
+    """Crop each band at full width and stack them, separated by blank space."""
+    gap = max(MIN_ROW_GAP, max(bottom - top for top, bottom in bands) // 2)
+    height = sum(bottom - top for top, bottom in bands) + gap * (len(bands) + 1)
+    stitched = load('PIL.Image').new(image.mode, (image.width, height), 'white')
+    y = gap
+    for top, bottom in bands:
+        stitched.paste(image.crop((0, top, image.width, bottom)), (0, y))
+        y += bottom - top + gap
+    return stitched
+
+
+def ocr_rows(image):
+    """
+    Two-pass OCR: find the analyte rows on a downscaled page, then OCR only
+    those rows at full resolution. Pages where no analyte is located are
+    OCR'd whole. Records the pixels read relative to a full-page pass.
+    """
+    page_pixels = image.width * image.height
+    with stage('roi_locate'):
+        bands = locate_rows(image)
+    locate_pixels = page_pixels * ROI_LOCATE_SCALE ** 2
+    if not bands:
+        logger.info('ROI OCR: no analyte rows located, reading the full page')
+        observe_roi_pixels((locate_pixels + page_pixels) / page_pixels)
+        with stage('roi_read'):
+            return ocr_image(image)
+    stitched = stitch_rows(image, bands)
+    fraction = (locate_pixels + stitched.width * stitched.height) / page_pixels
+    observe_roi_pixels(fraction)
+    logger.info(f'ROI OCR: {len(bands)} row bands, {fraction:.0%} of full-page pixels')
+    with stage('roi_read'):
+        return ocr_image(stitched)
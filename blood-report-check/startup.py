@@ -0,0 +1,63 @@
+import sys
+import time
+import logging
+import importlib
+import threading
+
+logger = logging.getLogger('BloodAnalysis')
+
+# Heavy dependencies, imported on first use rather than at module load
+HEAVY_MODULES = ['numpy', 'cv2', 'PIL.Image', 'pdfplumber', 'pydicom', 'pytesseract', 'preprocess', 'dicom_reader']
+
+IMPORT_TIMES = {}   # module -> seconds spent importing it
+WARMUP_TIMES = {}   # warm-up step -> seconds
+ready = threading.Event()
+_warmup_error = None
+
+
+def load(name):
+    """Import a module on first use, recording how long the import took."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_TIMES.setdefault(name, time.perf_counter() - start)
+    return module
+
+
+def run_warmup(steps):
+    """
+    Run (name, fn) warm-up steps in order, timing each one, then mark the
+    process ready. A failing step is logged and the process still becomes
+    ready, since every step is also performed lazily on first use.
+    """
+    global _warmup_error
+    for name, fn in steps:
+        start = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            _warmup_error = f'{name}: {e}'
+            logger.error(f'Warm-up step {name} failed: {e}')
+        WARMUP_TIMES[name] = time.perf_counter() - start
+    ready.set()
+    logger.info(f'Warm-up complete: {report()}')
+
+
+def start_warmup(steps):
+    thread = threading.Thread(target=run_warmup, args=(steps,), name='warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def report():
+    """Startup-time report: where import and warm-up time went, slowest first."""
+    def ms(times):
+        return {k: round(v * 1000, 1) for k, v in sorted(times.items(), key=lambda kv: -kv[1])}
+    return {
+        'ready': ready.is_set(),
+        'imports_ms': ms(IMPORT_TIMES),
+        'warmup_ms': ms(WARMUP_TIMES),
+        'error': _warmup_error,
+    }
@@ -0,0 +1,28 @@
+"""
+Mass <-> molar conversions are looked up by canonical analyte key, so
+MOLAR_MASSES must use the keys analytes.json resolves names to.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analytes import get_index  # noqa: E402
+from units import MOLAR_MASSES, conversion_factor  # noqa: E402
+
+
+def test_molar_mass_keys_are_canonical():
+    assert set(MOLAR_MASSES) - get_index().keys == set()
+
+
+@pytest.mark.parametrize('name, from_unit, to_unit, factor', [
+    ('serum creatinine', 'mg/dL', 'umol/L', 88.4),
+    ('blood urea nitrogen', 'mg/dL', 'mmol/L', 0.357),
+    ('serum iron', 'ug/dL', 'umol/L', 0.179),
+    ('glucose', 'mmol/L', 'mg/dL', 18.02),
+])
+def test_synonyms_convert(name, from_unit, to_unit, factor):
+    [(key, _, _)] = get_index().finditer(name)
+    assert conversion_factor(from_unit, to_unit, key) == pytest.approx(factor, rel=1e-2)
@@ -0,0 +1,52 @@
+import os
+import logging
+from startup import load
+from ocr import ocr_image, ocr_words, words_to_text
+from metrics import stage, count_ocr_tier
+
+logger = logging.getLogger('BloodAnalysis')
+
+# The cheap pass is kept when its mean word confidence (0-100) and its
+# analyte hit rate (0-1) both reach these; otherwise the page is escalated
+OCR_TIER_MIN_CONF = float(os.environ.get('OCR_TIER_MIN_CONF', 75))
+OCR_TIER_MIN_HIT_RATE = float(os.environ.get('OCR_TIER_MIN_HIT_RATE', 0.8))
+
+
+def ocr_tiered(source, hit_rate, full_ocr=ocr_image):
+    """
+    OCR a scanned report in tiers. The page is decoded once; the 'light'
+    tier OCRs it only converted to grayscale at OCR resolution, reading word
+    confidences. If that pass is unsure or hit_rate(text) is low, the
+    'full' tier denoises and binarises the page and OCRs it with full_ocr.
+    A page that cannot be decoded for preprocessing is OCR'd raw ('raw').
+    """
+    preprocess = load('preprocess')
+    with stage('enhance_image'):
+        try:
+            gray, scale = preprocess.load_page(source)
+        except Exception as e:
+            logger.error(f'Image enhancement failed: {e}')
+            gray = None
+        else:
+            light = preprocess.grayscale(gray, scale)
+    if gray is None:
+        count_ocr_tier('raw')
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        with stage('ocr'):
+            return full_ocr(load('PIL.Image').open(source))
+    with stage('ocr'):
+        words = ocr_words(light)
+    text = words_to_text(words)
+    conf = sum(w.conf for w in words) / len(words) if words else 0.0
+    rate = hit_rate(text)
+    if conf >= OCR_TIER_MIN_CONF and rate >= OCR_TIER_MIN_HIT_RATE:
+        count_ocr_tier('light')
+        return text
+
+    logger.info(f'Escalating OCR: confidence {conf:.0f}, analyte hit rate {rate:.2f}')
+    count_ocr_tier('full')
+    with stage('enhance_image'):
+        image = preprocess.binarize(gray, scale)
+    with stage('ocr'):
+        return full_ocr(image)
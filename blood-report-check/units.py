@@ -1,43 +1,154 @@
-from pint import UnitRegistry
-from pint.errors import UndefinedUnitError
+import functools
+import threading
+from itertools import product
 
-ureg = UnitRegistry()
-Q_ = ureg.Quantity
-
-# Define unit aliases mapping to standard units
+# Common unit spellings (lowercased) -> canonical unit
 UNIT_ALIASES = {
+    "mg/dl": "mg/dl",
+    "mg%": "mg/dl",
+    "g/dl": "g/dl",
+    "gm/dl": "g/dl",
+    "g/l": "g/l",
+    "mg/l": "mg/l",
+    "µg/dl": "ug/dl",
+    "μg/dl": "ug/dl",
+    "ug/dl": "ug/dl",
+    "mcg/dl": "ug/dl",
+    "ng/ml": "ng/ml",
+    "pg/ml": "pg/ml",
+    "mmol/l": "mmol/l",
+    "µmol/l": "umol/l",
+    "μmol/l": "umol/l",
+    "umol/l": "umol/l",
+    "nmol/l": "nmol/l",
+    "pmol/l": "pmol/l",
+    "iu/l": "iu/l",
+    "u/l": "iu/l",
+    "miu/l": "miu/l",
+    "uiu/ml": "miu/l",
+    "µiu/ml": "miu/l",
+    "μiu/ml": "miu/l",
+    "pg": "pg",
+    "fl": "fl",
+}
+
+# Canonical unit -> pint expression. pint is only used to build the table.
+PINT_UNITS = {
     "mg/dl": "milligram / deciliter",
-    "mmol/l": "millimole / liter",
+    "g/dl": "gram / deciliter",
     "g/l": "gram / liter",
     "mg/l": "milligram / liter",
-    "μmol/l": "micromole / liter",
+    "ug/dl": "microgram / deciliter",
+    "ng/ml": "nanogram / milliliter",
+    "pg/ml": "picogram / milliliter",
+    "mmol/l": "millimole / liter",
+    "umol/l": "micromole / liter",
+    "nmol/l": "nanomole / liter",
+    "pmol/l": "picomole / liter",
     "iu/l": "international_unit / liter",
-    "cells/hpf": "count / high_power_field",
-    "cfu/ml": "colony_forming_unit / milliliter",
-    "sp hpf": "count / high_power_field",
+    "miu/l": "milliinternational_unit / liter",
+    "pg": "picogram",
+    "fl": "femtoliter",
 }
 
+# Molar masses (g/mol) for analytes reported in both mass and molar units,
+# keyed by their canonical key in analytes.json
+MOLAR_MASSES = {
+    "glucose": 180.156,
+    "fastingplasmaglucose": 180.156,
+    "2hourpostprandialglucose": 180.156,
+    "creatinine": 113.12,
+    "totalcholesterol": 386.65,
+    "ldlcholesterol": 386.65,
+    "hdlcholesterol": 386.65,
+    "triglycerides": 885.7,
+    "totalbilirubin": 584.66,
+    "bun": 28.014,  # reported as urea nitrogen (N2)
+    "iron": 55.845,
+}
+
+_table = None
+_table_lock = threading.Lock()
+
+
 def normalize_unit(unit: str) -> str:
     """
-    Normalize common unit variants to Pint-compatible format.
-    Returns a cleaned version or raises an error if invalid.
+    Normalize common unit variants to their canonical spelling.
+    Unknown units are returned lowercased and stripped.
     """
     if not unit:
         return ""
     key = unit.strip().lower()
-    return UNIT_ALIASES.get(key, key)  # fallback to user input if no alias
+    return UNIT_ALIASES.get(key, key)
+
+
+def build_conversion_table():
+    """
+    Precompute multiplicative factors for every convertible pair of
+    canonical units: {(from_unit, to_unit, analyte): factor}. analyte is None
+    for plain dimensional conversions and set for mass <-> molar ones.
+    """
+    from pint import UnitRegistry
+    from pint.errors import DimensionalityError
+
+    ureg = UnitRegistry()
+    ureg.define("international_unit = [enzyme_activity] = IU")
+    units = {name: ureg.parse_units(expr) for name, expr in PINT_UNITS.items()}
+    mass_conc = ureg.parse_units("gram / liter")
+    molar_conc = ureg.parse_units("mole / liter")
+
+    table = {}
+    for (a, ua), (b, ub) in product(units.items(), repeat=2):
+        try:
+            table[(a, b, None)] = ureg.Quantity(1, ua).to(ub).magnitude
+            continue
+        except DimensionalityError:
+            pass
+        if ua.dimensionality == mass_conc.dimensionality and ub.dimensionality == molar_conc.dimensionality:
+            # a -> g/L, divide by molar mass -> mol/L -> b
+            to_grams = ureg.Quantity(1, ua).to(mass_conc).magnitude
+            from_moles = ureg.Quantity(1, molar_conc).to(ub).magnitude
+            for analyte, mw in MOLAR_MASSES.items():
+                table[(a, b, analyte)] = to_grams / mw * from_moles
+        elif ua.dimensionality == molar_conc.dimensionality and ub.dimensionality == mass_conc.dimensionality:
+            to_moles = ureg.Quantity(1, ua).to(molar_conc).magnitude
+            from_grams = ureg.Quantity(1, mass_conc).to(ub).magnitude
+            for analyte, mw in MOLAR_MASSES.items():
+                table[(a, b, analyte)] = to_moles * mw * from_grams
+    return table
+
+
+def get_conversion_table():
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = build_conversion_table()
+    return _table
+
+
+@functools.lru_cache(maxsize=4096)
+def conversion_factor(from_unit: str, to_unit: str, analyte: str = None) -> float:
+    """
+    Multiplicative factor converting from_unit to to_unit for an analyte.
+    Raises ValueError if the conversion is not known.
+    """
+    from_unit_norm = normalize_unit(from_unit)
+    to_unit_norm = normalize_unit(to_unit)
+    if from_unit_norm == to_unit_norm:
+        return 1.0
+    table = get_conversion_table()
+    factor = table.get((from_unit_norm, to_unit_norm, None))
+    if factor is None:
+        factor = table.get((from_unit_norm, to_unit_norm, analyte))
+    if factor is None:
+        raise ValueError(f"Cannot convert {from_unit!r} to {to_unit!r}" + (f" for {analyte}" if analyte else ""))
+    return factor
+
 
-def convert_value(value: float, from_unit: str, to_unit: str) -> float:
+def convert_value(value: float, from_unit: str, to_unit: str, analyte: str = None) -> float:
     """
-    Convert a value from one unit to another using Pint.
+    Convert a value from one unit to another using the precomputed table.
     Raises ValueError if conversion is not possible.
     """
-    try:
-        from_unit_norm = normalize_unit(from_unit)
-        to_unit_norm = normalize_unit(to_unit)
-        quantity = Q_(value, from_unit_norm)
-        return quantity.to(to_unit_norm).magnitude
-    except UndefinedUnitError as e:
-        raise ValueError(f"Unrecognized unit: {e}")
-    except Exception as e:
-        raise ValueError(f"Conversion failed: {e}")
+    return value * conversion_factor(from_unit, to_unit, analyte)
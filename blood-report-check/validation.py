@@ -0,0 +1,157 @@
+import os
+import io
+from tempfile import SpooledTemporaryFile
+
+from flask import Request
+
+# Whole request body; larger uploads are refused with 413 while streaming in
+MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 32 * 1024 * 1024))
+MAX_PDF_PAGES = int(os.environ.get('MAX_PDF_PAGES', 50))
+# Width x height of an image or DICOM frame
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 50_000_000))
+MAX_DICOM_FRAMES = int(os.environ.get('MAX_DICOM_FRAMES', 64))
+
+SNIFF_BYTES = 4096
+# Extension -> file type its content must sniff as
+EXTENSION_TYPES = {'.pdf': 'pdf', '.png': 'png', '.jpg': 'jpeg', '.jpeg': 'jpeg', '.dcm': 'dicom'}
+
+
+class UploadRejected(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff_type(head):
+    """Identify a file from its first bytes; None if unrecognised."""
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head[128:132] == b'DICM':
+        return 'dicom'
+    # PDF readers accept the header anywhere in the first 1 KB
+    if b'%PDF-' in head[:1024]:
+        return 'pdf'
+    return None
+
+
+class UploadRequest(Request):
+    """
+    Request whose multipart file parts are checked while Werkzeug receives
+    them (see _SniffingFile), so a mismatched or oversized upload is refused
+    without reading the rest of the body. Set as the app's request_class.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return _SniffingFile(filename)
+
+
+class _SniffingFile(SpooledTemporaryFile):
+    """
+    Spool file for one upload (in memory up to 500 KB, as Werkzeug's own)
+    that runs the header checks once the first SNIFF_BYTES have arrived:
+    content against extension, then image / DICOM dimensions where the
+    header fits in those bytes. Files with an unknown extension are left to
+    the view. PDF page counts need the whole file; validate_upload does them.
+    """
+
+    def __init__(self, filename):
+        super().__init__(max_size=500 * 1024, mode='rb+')
+        self.filename = filename or ''
+        self.extension = os.path.splitext(self.filename)[1].lower()
+        self._head = b'' if self.extension in EXTENSION_TYPES else None
+
+    def write(self, data):
+        if self._head is not None:
+            self._head += data
+            if len(self._head) >= SNIFF_BYTES:
+                self._check_head()
+        return super().write(data)
+
+    def seek(self, *args):
+        # The parser rewinds each file once it is complete; short files are
+        # checked then
+        if self._head is not None:
+            self._check_head()
+        return super().seek(*args)
+
+    def _check_head(self):
+        head, self._head = self._head[:SNIFF_BYTES], None
+        try:
+            found = _check_type(head, self.extension)
+            if found == 'dicom':
+                _check_dicom(io.BytesIO(head))
+            elif found != 'pdf':
+                _check_image(io.BytesIO(head))
+        except UploadRejected as e:
+            raise UploadRejected(f'{self.filename}: {e}', e.status)
+        except Exception:
+            pass  # header runs past the sniffed bytes; validate_upload reads it
+
+
+def validate_upload(stream, extension):
+    """
+    Check an uploaded file before any extraction: the content must match
+    the extension, and page count / pixel dimensions must be within limits.
+    Runs on the parsed upload, after UploadRequest's early checks, and
+    parses only headers. The stream is rewound; raises UploadRejected.
+    """
+    found = _check_type(stream.read(SNIFF_BYTES), extension)
+    stream.seek(0)
+    try:
+        if found == 'pdf':
+            _check_pdf(stream)
+        elif found == 'dicom':
+            _check_dicom(stream)
+        else:
+            _check_image(stream)
+    except UploadRejected:
+        raise
+    except Exception as e:
+        raise UploadRejected(f'Unreadable {found.upper()} file: {e}')
+    finally:
+        stream.seek(0)
+
+
+def _check_type(head, extension):
+    expected = EXTENSION_TYPES.get(extension)
+    found = sniff_type(head)
+    if expected is None or found != expected:
+        raise UploadRejected(f'File content does not match {extension or "its"} extension')
+    return found
+
+
+def _check_image(stream):
+    from PIL import Image
+    # Also arms PIL's own decompression-bomb check for later decoding
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    try:
+        with Image.open(stream) as image:  # reads the header only
+            width, height = image.size
+    except Image.DecompressionBombError as e:
+        raise UploadRejected(str(e), 413)
+    _check_pixels(width, height)
+
+
+def _check_pdf(stream):
+    import pdfplumber
+    with pdfplumber.open(stream) as pdf:
+        pages = len(pdf.pages)
+    if pages > MAX_PDF_PAGES:
+        raise UploadRejected(f'PDF has {pages} pages (max {MAX_PDF_PAGES})', 413)
+
+
+def _check_dicom(stream):
+    import pydicom
+    ds = pydicom.dcmread(stream, stop_before_pixels=True,
+                         specific_tags=['Rows', 'Columns', 'NumberOfFrames'])
+    frames = int(ds.get('NumberOfFrames', 1) or 1)
+    if frames > MAX_DICOM_FRAMES:
+        raise UploadRejected(f'DICOM has {frames} frames (max {MAX_DICOM_FRAMES})', 413)
+    _check_pixels(ds.get('Columns', 0), ds.get('Rows', 0))
+
+
+def _check_pixels(width, height):
+    if width * height > MAX_IMAGE_PIXELS:
+        raise UploadRejected(f'Image is {width}x{height} pixels (max {MAX_IMAGE_PIXELS})', 413)
@@ -0,0 +1,23 @@
+"""
+Modules both services use are kept as identical copies in each service
+directory, since each Docker image is built from its own directory only.
+Edit one copy, then copy it over the other.
+"""
+import os
+import difflib
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES = ['blood-report-check', 'urine-report-check']
+SHARED = ['cache.py', 'concurrency.py', 'deadline.py', 'dicom_reader.py', 'gunicorn.conf.py',
+          'jobs.py', 'logs.py', 'offline.py', 'preprocess.py', 'profiling.py', 'validation.py']
+
+
+@pytest.mark.parametrize('name', SHARED)
+def test_copies_identical(name):
+    first, second = (os.path.join(ROOT, service, name) for service in SERVICES)
+    with open(first, encoding='utf-8') as a, open(second, encoding='utf-8') as b:
+        a_lines, b_lines = a.readlines(), b.readlines()
+    diff = ''.join(difflib.unified_diff(a_lines, b_lines, first, second))
+    assert not diff, f'{name} differs between services:\n{diff}'
@@ -1,21 +1,56 @@
+import io
 import os
 import re
+import functools
+from collections import namedtuple
 import uuid
 import logging
-from logging.handlers import RotatingFileHandler
-from flask import Flask, request, jsonify, send_from_directory, abort, render_template
+import tempfile
+from flask import Flask, Response, request, jsonify, send_from_directory, abort, render_template
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from PIL import Image, ImageEnhance
-import pytesseract
 import pdfplumber
-import pydicom
+from cache import ResultCache, make_key
+from jobs import JobFailed, JobQueue, QueueFull
+from ocr import ocr_image
+from preprocess import prepare_for_ocr
+from tiers import ocr_tiered
+from dicom_reader import read_header, header_text, wants_ocr, ocr_frames
+from metrics import stage, count_file, count_failure, render as render_metrics
+from profiling import profiled
+from concurrency import Saturated, RETRY_AFTER
+from logs import setup_logging, correlation
+from deadline import DeadlineExceeded, budget, limited, expired, mark_partial, is_partial
+from validation import MAX_CONTENT_LENGTH, UploadRejected, UploadRequest, validate_upload
 
 # Configuration
 UPLOAD_DIR = 'uploads'
 PORT = 5001
 LOG_FILE = 'app.log'
 ALLOWED_EXT = {'.pdf', '.jpeg', '.jpg', '.png', '.dcm'}
+RESULT_CACHE_ENTRIES = int(os.environ.get('RESULT_CACHE_ENTRIES', 256))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', 3600))
+# Stop reading PDF pages once every field in PDF_TARGET_FIELDS (comma-separated
+# scan_report fields, e.g. "chem.pH,microscopic.wbc") has been found or
+# PDF_PAGE_BUDGET pages have been read (0 = no page limit)
+PDF_TARGET_FIELDS = frozenset(
+    field.strip() for field in os.environ.get('PDF_TARGET_FIELDS', '').split(',') if field.strip())
+PDF_PAGE_BUDGET = int(os.environ.get('PDF_PAGE_BUDGET', 0))
+# Tiered OCR of image reports: OCR the plain grayscale page first and only
+# denoise/binarise and OCR again when confidence or label hit rate is low
+# (thresholds in tiers.py). Off = always the full preprocessing.
+OCR_TIERED = os.environ.get('OCR_TIERED', '0') == '1'
+# Uploads up to this size are analysed from memory; larger ones spill to UPLOAD_DIR
+UPLOAD_SPOOL_THRESHOLD = int(os.environ.get('UPLOAD_SPOOL_THRESHOLD', 8 * 1024 * 1024))
+# Background analysis jobs (POST /diagnostics/upload?async=1, then GET /jobs/<id>)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_QUEUE_DEPTH = int(os.environ.get('JOB_QUEUE_DEPTH', 32))
+JOB_RETENTION = int(os.environ.get('JOB_RETENTION', 900))
+# Job state, shared by every server worker process so any of them can answer a poll.
+# Must be on node-local disk: SQLite's WAL mode does not work on network
+# filesystems, which is what UPLOAD_DIR may be (a PVC shared by replicas).
+JOB_STORE = os.environ.get('JOB_STORE', os.path.join(tempfile.gettempdir(), 'urine-jobs.sqlite3'))
 
 # Ensure upload directory exists
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -26,88 +61,126 @@ app = Flask(
     static_folder=None,
     template_folder='templates'
 )
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+app.request_class = UploadRequest
 CORS(app)
 
-# Logging setup with rotation
+# Logging: rotating JSON lines keyed by cid, written by a background thread
 logger = logging.getLogger('flask_app')
-logger.setLevel(logging.DEBUG)
 LOG_FILE = os.path.join(UPLOAD_DIR, 'app.log')
-handler = RotatingFileHandler(LOG_FILE, maxBytes=10*1024*1024, backupCount=3)
-formatter = logging.Formatter('%(asctime)s | %(levelname)s | %(cid)s | %(message)s')
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+setup_logging(logger, LOG_FILE, max_bytes=10*1024*1024, backup_count=3)
+
+# Result cache for resubmitted reports, keyed by upload content
+result_cache = ResultCache(RESULT_CACHE_ENTRIES, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL)
+job_queue = JobQueue(JOB_STORE, JOB_WORKERS, JOB_QUEUE_DEPTH, JOB_RETENTION)
 
 @app.before_request
 def before_request():
     cid = request.headers.get('X-Correlation-Id', str(uuid.uuid4()))
     request.cid = cid
     request.logger = logging.LoggerAdapter(logger, {'cid': cid})
-    request.logger.info(f"Incoming {request.method} {request.path} from {request.remote_addr}")
+    request.logger.debug("Incoming %s %s from %s", request.method, request.path, request.remote_addr)
 
 # ---------------------------
 # Helper Functions: File Extraction & Preprocessing
 # ---------------------------
-def preprocess_image(path):
+def upload_source(content, name):
+    """
+    Wrap uploaded bytes for extraction: an in-memory buffer up to
+    UPLOAD_SPOOL_THRESHOLD, otherwise a spill file under UPLOAD_DIR.
+    Returns (source, spill_path); spill_path is None for in-memory sources.
+    """
+    if len(content) <= UPLOAD_SPOOL_THRESHOLD:
+        return io.BytesIO(content), None
+    spill_path = os.path.join(UPLOAD_DIR, name)
+    with stage('upload_save'), open(spill_path, 'wb') as out:
+        out.write(content)
+    return spill_path, spill_path
+
+def preprocess_image(source):
     try:
-        img = Image.open(path).convert('L')
-        enhancer = ImageEnhance.Contrast(img)
-        img = enhancer.enhance(2.0)
-        img = img.resize((img.width * 2, img.height * 2))
-        return img
+        return prepare_for_ocr(source)
     except Exception as e:
         logger.error(f"Error in preprocess_image: {e}")
         return None
 
-def extract_text(path, ext):
+def extract_text(source, ext):
+    """Extract report text from a file path or a seekable file-like object."""
     text = ""
     try:
-        if ext in {'.jpeg', '.jpg', '.png'}:
-            img = preprocess_image(path)
+        if ext in {'.jpeg', '.jpg', '.png'} and OCR_TIERED:
+            text = ocr_tiered(source, label_hit_rate)
+        elif ext in {'.jpeg', '.jpg', '.png'}:
+            with stage('preprocess'):
+                img = preprocess_image(source)
             if img:
-                text = pytesseract.image_to_string(img)
+                with stage('ocr'):
+                    text = ocr_image(img)
         elif ext == '.pdf':
-            with pdfplumber.open(path) as pdf:
+            with stage('pdf_text'), pdfplumber.open(source) as pdf:
+                pages_read = 0
                 for page in pdf.pages:
+                    if expired():
+                        logger.warning(f"Time budget exhausted after {pages_read} of {len(pdf.pages)} PDF pages")
+                        count_failure('deadline_partial')
+                        mark_partial()
+                        break
+                    pages_read += 1
                     page_text = page.extract_text()
                     if page_text:
                         text += page_text + "\n"
+                    if PDF_PAGE_BUDGET and pages_read >= PDF_PAGE_BUDGET:
+                        break
+                    # Feed the text so far to the scanner; later pages are never read once done
+                    if PDF_TARGET_FIELDS and PDF_TARGET_FIELDS <= scan_report(text).keys():
+                        break
+                if pages_read < len(pdf.pages):
+                    logger.info(f"Stopped PDF extraction after {pages_read} of {len(pdf.pages)} pages")
         elif ext == '.dcm':
-            ds = pydicom.dcmread(path)
-            text = "\n".join(f"{e.keyword}: {e.value}" for e in ds if hasattr(e, 'keyword'))
+            with stage('dicom_read'):
+                ds = read_header(source)
+                text = header_text(ds)
+            if wants_ocr(ds, str(ds.get('PatientComments', ''))):
+                with stage('ocr'):
+                    text += "\n" + ocr_frames(source, ds, ocr_image)
+    except (Saturated, DeadlineExceeded):
+        raise
     except Exception as e:
         logger.error(f"Error extracting text: {e}")
+        count_failure('extraction_error')
     return text
 
 # ---------------------------
 # Advanced Urine Test Analysis Modules
 # ---------------------------
+# Analyzers return Finding(code, message) lists. The code drives the
+# recommendation lookup; the message is only used to render the report.
+Finding = namedtuple('Finding', ['code', 'message'])
+
 def analyze_microbiology(bacterial_load, microbial_composition, detected_pathogens, resistance_genes, symptoms):
     results = []
     BA_THRESHOLD = 1e5
     try:
         if bacterial_load >= BA_THRESHOLD:
-            results.append("High bacterial load indicates potential infection.")
+            results.append(Finding("bacterial_load_high", "High bacterial load indicates potential infection."))
     except Exception as e:
-        results.append("Bacterial load value error.")
+        results.append(Finding(None, "Bacterial load value error."))
         logger.error(f"Error checking bacterial load: {e}")
 
     beneficial_pct = microbial_composition.get("lactobacillus gasseri", 0)
     if beneficial_pct < 70:
-        results.append("Low proportion of beneficial bacteria (Lactobacillus spp.) suggests imbalance.")
+        results.append(Finding("beneficial_bacteria_low",
+                               "Low proportion of beneficial bacteria (Lactobacillus spp.) suggests imbalance."))
 
     common_pathogens = {"escherichia coli", "klebsiella pneumoniae", "staphylococcus aureus"}
-    common_detected = set([p.lower() for p in detected_pathogens]).intersection(common_pathogens)
+    common_detected = [p for p in dict.fromkeys(p.lower() for p in detected_pathogens) if p in common_pathogens]
     if common_detected:
-        results.append("Detected common pathogens: " + ", ".join(common_detected))
+        results.append(Finding("pathogens_detected", "Detected common pathogens: " + ", ".join(common_detected)))
     if resistance_genes:
-        results.append("Resistance genes detected; correlate with clinical findings.")
+        results.append(Finding("resistance_genes", "Resistance genes detected; correlate with clinical findings."))
     if symptoms:
-        results.append("Patient is symptomatic, warranting further evaluation.")
-
-    if not results:
-        return "Microbiology (Culture) Analysis: Normal."
-    else:
-        return "Microbiology (Culture) Analysis: " + " | ".join(results)
+        results.append(Finding("symptomatic", "Patient is symptomatic, warranting further evaluation."))
+    return results
 
 def analyze_chemistry(chem_data):
     results = []
@@ -115,87 +188,88 @@ def analyze_chemistry(chem_data):
         if "pH" in chem_data:
             pH = chem_data["pH"]
             if pH < 4.6 or pH > 8.0:
-                results.append(f"pH ({pH}) is out of the normal range (4.6–8.0).")
+                results.append(Finding("ph_abnormal", f"pH ({pH}) is out of the normal range (4.6–8.0)."))
         if "color" in chem_data:
             color = chem_data["color"].lower()
             if any(x in color for x in ["red", "brown", "cloudy"]):
-                results.append(f"Color '{chem_data['color']}' is abnormal.")
+                results.append(Finding("color_abnormal", f"Color '{chem_data['color']}' is abnormal."))
         if "clarity" in chem_data:
             clarity = chem_data["clarity"].lower()
             if clarity not in ["clear", "normal"]:
-                results.append(f"Clarity '{chem_data['clarity']}' is abnormal.")
+                results.append(Finding("clarity_abnormal", f"Clarity '{chem_data['clarity']}' is abnormal."))
         if "odor" in chem_data:
             odor = chem_data["odor"].lower()
             if "fruity" in odor or "foul" in odor:
-                results.append(f"Odor '{chem_data['odor']}' is abnormal.")
+                results.append(Finding("odor_abnormal", f"Odor '{chem_data['odor']}' is abnormal."))
         if "specific_gravity" in chem_data:
             sg = chem_data["specific_gravity"]
             if sg < 1.005 or sg > 1.030:
-                results.append(f"Specific Gravity ({sg}) is out of range (1.005–1.030).")
+                results.append(Finding("specific_gravity_abnormal",
+                                       f"Specific Gravity ({sg}) is out of range (1.005–1.030)."))
         if "protein" in chem_data:
             protein = chem_data["protein"]
             if protein > 15:
-                results.append(f"Protein level ({protein} mg/dL) is elevated (normal <15 mg/dL).")
+                results.append(Finding("protein_elevated",
+                                       f"Protein level ({protein} mg/dL) is elevated (normal <15 mg/dL)."))
         for param in ["glucose", "ketones", "blood", "nitrites", "leukocyte_esterase"]:
             if param in chem_data:
                 value = chem_data[param].lower()
                 if value != "negative":
-                    results.append(f"{param.capitalize()} is abnormal: {chem_data[param]}.")
+                    results.append(Finding(f"{param}_abnormal", f"{param.capitalize()} is abnormal: {chem_data[param]}."))
         if "microalbumin" in chem_data:
             microalbumin = chem_data["microalbumin"]
             if microalbumin > 30:
-                results.append(f"Microalbumin ({microalbumin} mg/day) is elevated (normal <30 mg/day).")
+                results.append(Finding("microalbumin_elevated",
+                                       f"Microalbumin ({microalbumin} mg/day) is elevated (normal <30 mg/day)."))
     except Exception as e:
-        results.append("Chemical data error.")
+        results.append(Finding(None, "Chemical data error."))
         logger.error(f"Error in chemistry analysis: {e}")
-
-    if not results:
-        return "Chemical Analysis (Dipstick): All parameters are normal."
-    else:
-        return "Chemical Analysis (Dipstick): " + " | ".join(results)
+    return results
 
 def analyze_microscopic(microscopic_data):
     results = []
     try:
         if "rbc" in microscopic_data:
             if microscopic_data["rbc"] > 3:
-                results.append(f"RBC count ({microscopic_data['rbc']}/HPF) is elevated (normal 0-3/HPF).")
+                results.append(Finding("rbc_elevated",
+                                       f"RBC count ({microscopic_data['rbc']}/HPF) is elevated (normal 0-3/HPF)."))
         if "wbc" in microscopic_data:
             if microscopic_data["wbc"] >= 5:
-                results.append(f"WBC count ({microscopic_data['wbc']}/HPF) is high (normal <5/HPF).")
+                results.append(Finding("wbc_elevated",
+                                       f"WBC count ({microscopic_data['wbc']}/HPF) is high (normal <5/HPF)."))
         if "casts" in microscopic_data:
             casts = microscopic_data["casts"].lower()
             if casts not in ["none", "negative", "rare", ""]:
-                results.append(f"Casts reported as '{microscopic_data['casts']}' may be abnormal.")
+                results.append(Finding("casts_abnormal",
+                                       f"Casts reported as '{microscopic_data['casts']}' may be abnormal."))
         if "crystals" in microscopic_data:
             crystals = microscopic_data["crystals"].lower()
             if crystals not in ["none", "negative", "rare", ""]:
-                results.append(f"Crystals reported as '{microscopic_data['crystals']}' may indicate pathology.")
+                results.append(Finding("crystals_abnormal",
+                                       f"Crystals reported as '{microscopic_data['crystals']}' may indicate pathology."))
         if "epithelial_cells" in microscopic_data:
             if microscopic_data["epithelial_cells"] > 5:
-                results.append(f"Epithelial cells count ({microscopic_data['epithelial_cells']}/HPF) is high (normal <5/HPF).")
+                results.append(Finding("epithelial_cells_high",
+                                       f"Epithelial cells count ({microscopic_data['epithelial_cells']}/HPF) "
+                                       f"is high (normal <5/HPF)."))
     except Exception as e:
-        results.append("Microscopic data error.")
+        results.append(Finding(None, "Microscopic data error."))
         logger.error(f"Error in microscopic analysis: {e}")
-
-    if not results:
-        return "Microscopic Analysis: Normal findings."
-    else:
-        return "Microscopic Analysis: " + " | ".join(results)
+    return results
 
 def analyze_24hour_volume(volume):
     try:
         if volume is None:
-            return "No 24-hour urine volume provided."
+            return [Finding(None, "No 24-hour urine volume provided.")]
         if volume < 600:
-            return f"24-Hour Urine Volume ({volume} mL) is low (oliguria)."
+            return [Finding("volume_low", f"24-Hour Urine Volume ({volume} mL) is low (oliguria).")]
         elif volume > 3600:
-            return f"24-Hour Urine Volume ({volume} mL) is high (polyuria)."
+            return [Finding("volume_high", f"24-Hour Urine Volume ({volume} mL) is high (polyuria).")]
         else:
-            return f"24-Hour Urine Volume ({volume} mL) is within the normal range."
+            return [Finding(None, f"24-Hour Urine Volume ({volume} mL) is within the normal range.")]
     except Exception as e:
         logger.error(f"Error in volume analysis: {e}")
-        return "24-Hour Volume analysis error."
+        return [Finding(None, "24-Hour Volume analysis error.")]
 
 def analyze_rapid_urine(rapid_data):
     issues = []
@@ -204,215 +278,300 @@ def analyze_rapid_urine(rapid_data):
             if param in rapid_data:
                 value = rapid_data[param].lower()
                 if value != "negative":
-                    issues.append(f"{param.capitalize()} abnormal: {rapid_data[param]}")
+                    issues.append(Finding("rapid_abnormal", f"{param.capitalize()} abnormal: {rapid_data[param]}"))
     except Exception as e:
         logger.error(f"Error in rapid urine analysis: {e}")
-        issues.append("Rapid urine data error.")
-    if issues:
-        return "Rapid Urine Test: Abnormal - " + " | ".join(issues)
-    else:
-        return "Rapid Urine Test: Normal."
+        issues.append(Finding("rapid_abnormal", "Rapid urine data error."))
+    return issues
 
 def analyze_pregnancy_test(pregnancy_data):
     try:
         if "result" in pregnancy_data:
             result = pregnancy_data["result"].lower()
             if result == "positive":
-                return "Pregnancy Test: Positive."
+                return [Finding("pregnancy_positive", "Pregnancy Test: Positive.")]
             elif result == "negative":
-                return "Pregnancy Test: Negative."
+                return [Finding(None, "Pregnancy Test: Negative.")]
             else:
-                return f"Pregnancy Test: Unclear result ({pregnancy_data['result']})."
+                return [Finding(None, f"Pregnancy Test: Unclear result ({pregnancy_data['result']}).")]
         if "hcg" in pregnancy_data:
             try:
                 hcg_value = float(pregnancy_data["hcg"])
             except ValueError:
-                return "Pregnancy Test: Invalid hCG value."
+                return [Finding(None, "Pregnancy Test: Invalid hCG value.")]
             if hcg_value >= 20:
-                return f"Pregnancy Test: Positive (hCG: {hcg_value} mIU/mL)."
+                return [Finding("pregnancy_positive", f"Pregnancy Test: Positive (hCG: {hcg_value} mIU/mL).")]
             else:
-                return f"Pregnancy Test: Negative (hCG: {hcg_value} mIU/mL)."
+                return [Finding(None, f"Pregnancy Test: Negative (hCG: {hcg_value} mIU/mL).")]
     except Exception as e:
         logger.error(f"Error in pregnancy test analysis: {e}")
-        return "Pregnancy Test analysis error."
-    return "Pregnancy Test: Insufficient data."
+        return [Finding(None, "Pregnancy Test analysis error.")]
+    return [Finding(None, "Pregnancy Test: Insufficient data.")]
+
+# Section -> (prefix for its findings, text when it has none)
+SECTION_FORMATS = {
+    "microbiology": ("Microbiology (Culture) Analysis: ", "Microbiology (Culture) Analysis: Normal."),
+    "chemistry": ("Chemical Analysis (Dipstick): ", "Chemical Analysis (Dipstick): All parameters are normal."),
+    "microscopic": ("Microscopic Analysis: ", "Microscopic Analysis: Normal findings."),
+    "volume": ("24-Hour Volume: ", ""),
+    "volume_only": ("24-Hour Volume Analysis: ", ""),
+    "rapid": ("Rapid Urine Test: Abnormal - ", "Rapid Urine Test: Normal."),
+    "pregnancy": ("", ""),
+    "error": ("", ""),
+}
 
-def analyze_urine_test(data):
+def render_section(section, findings):
+    prefix, normal = SECTION_FORMATS[section]
+    if not findings:
+        return normal
+    return prefix + " | ".join(f.message for f in findings)
+
+def _microbiology_findings(micro):
+    return analyze_microbiology(
+        bacterial_load=micro.get("bacterial_load", 0),
+        microbial_composition=micro.get("microbial_composition", {}),
+        detected_pathogens=micro.get("detected_pathogens", []),
+        resistance_genes=micro.get("resistance_genes", []),
+        symptoms=micro.get("symptoms", False)
+    )
+
+def evaluate_urine_test(data):
+    """Run the analyzers selected by test_type; returns [(section, findings)]."""
     test_type = data.get("test_type", "full").lower()
     sections = []
     try:
         if test_type == "rapid":
-            sections.append(analyze_rapid_urine(data.get("rapid_data", {})))
+            sections.append(("rapid", analyze_rapid_urine(data.get("rapid_data", {}))))
         elif test_type == "complete":
-            sections.append(analyze_chemistry(data.get("chem_data", {})))
+            sections.append(("chemistry", analyze_chemistry(data.get("chem_data", {}))))
             if "microscopic_data" in data:
-                sections.append(analyze_microscopic(data.get("microscopic_data", {})))
+                sections.append(("microscopic", analyze_microscopic(data.get("microscopic_data", {}))))
         elif test_type == "culture":
-            micro = data.get("micro_data", {})
-            sections.append(analyze_microbiology(
-                bacterial_load=micro.get("bacterial_load", 0),
-                microbial_composition=micro.get("microbial_composition", {}),
-                detected_pathogens=micro.get("detected_pathogens", []),
-                resistance_genes=micro.get("resistance_genes", []),
-                symptoms=micro.get("symptoms", False)
-            ))
+            sections.append(("microbiology", _microbiology_findings(data.get("micro_data", {}))))
         elif test_type == "24-hour":
-            sections.append("24-Hour Volume Analysis: " + analyze_24hour_volume(data.get("urine_volume")))
+            sections.append(("volume_only", analyze_24hour_volume(data.get("urine_volume"))))
         elif test_type == "pregnancy":
-            sections.append(analyze_pregnancy_test(data.get("pregnancy_data", {})))
+            sections.append(("pregnancy", analyze_pregnancy_test(data.get("pregnancy_data", {}))))
         else:  # full integration
             if "micro_data" in data:
-                micro = data.get("micro_data", {})
-                sections.append(analyze_microbiology(
-                    bacterial_load=micro.get("bacterial_load", 0),
-                    microbial_composition=micro.get("microbial_composition", {}),
-                    detected_pathogens=micro.get("detected_pathogens", []),
-                    resistance_genes=micro.get("resistance_genes", []),
-                    symptoms=micro.get("symptoms", False)
-                ))
+                sections.append(("microbiology", _microbiology_findings(data.get("micro_data", {}))))
             if "chem_data" in data:
-                sections.append(analyze_chemistry(data.get("chem_data", {})))
+                sections.append(("chemistry", analyze_chemistry(data.get("chem_data", {}))))
             if "microscopic_data" in data:
-                sections.append(analyze_microscopic(data.get("microscopic_data", {})))
+                sections.append(("microscopic", analyze_microscopic(data.get("microscopic_data", {}))))
             if "urine_volume" in data:
-                sections.append("24-Hour Volume: " + analyze_24hour_volume(data.get("urine_volume")))
+                sections.append(("volume", analyze_24hour_volume(data.get("urine_volume"))))
             if "rapid_data" in data:
-                sections.append(analyze_rapid_urine(data.get("rapid_data", {})))
+                sections.append(("rapid", analyze_rapid_urine(data.get("rapid_data", {}))))
             if "pregnancy_data" in data:
-                sections.append(analyze_pregnancy_test(data.get("pregnancy_data", {})))
+                sections.append(("pregnancy", analyze_pregnancy_test(data.get("pregnancy_data", {}))))
     except Exception as e:
         logger.error(f"Error in overall urine analysis: {e}")
-        sections.append("Overall urine analysis error.")
-    return "\n".join(sections)
+        sections.append(("error", [Finding(None, "Overall urine analysis error.")]))
+    return sections
+
+def render_report(sections):
+    return "\n".join(render_section(section, findings) for section, findings in sections)
+
+def analyze_urine_test(data):
+    return render_report(evaluate_urine_test(data))
 
 # ---------------------------
 # Parsing the Report Text
 # ---------------------------
-def parse_report_text(text):
-    data = {}
-    chem_data = {}
-    microscopic_data = {}
-    micro_data = {}
-    rapid_data = {}
-    pregnancy_data = {}
-
+def _float_or_zero(value):
     try:
-        # Chemical Analysis
-        m = re.search(r"pH[:\s]+([\d\.]+)", text, re.IGNORECASE)
-        if m: chem_data["pH"] = float(m.group(1))
-        m = re.search(r"Color[:\s]+([\w\s]+)", text, re.IGNORECASE)
-        if m: chem_data["color"] = m.group(1).strip()
-        m = re.search(r"Clarity[:\s]+([\w\s]+)", text, re.IGNORECASE)
-        if m: chem_data["clarity"] = m.group(1).strip()
-        m = re.search(r"Odor[:\s]+([\w\s]+)", text, re.IGNORECASE)
-        if m: chem_data["odor"] = m.group(1).strip()
-        m = re.search(r"Specific\s*Gravity[:\s]+([\d\.]+)", text, re.IGNORECASE)
-        if m: chem_data["specific_gravity"] = float(m.group(1))
-        m = re.search(r"Protein[:\s]+([\d\.]+)\s*mg/dL", text, re.IGNORECASE)
-        if m: chem_data["protein"] = float(m.group(1))
-        m = re.search(r"Glucose[:\s]+(negative|positive)", text, re.IGNORECASE)
-        if m: chem_data["glucose"] = m.group(1).lower()
-        m = re.search(r"Ketones[:\s]+(negative|positive)", text, re.IGNORECASE)
-        if m: chem_data["ketones"] = m.group(1).lower()
-        m = re.search(r"Blood[:\s]+(negative|positive)", text, re.IGNORECASE)
-        if m: chem_data["blood"] = m.group(1).lower()
-        m = re.search(r"Nitrites[:\s]+(negative|positive)", text, re.IGNORECASE)
-        if m: chem_data["nitrites"] = m.group(1).lower()
-        m = re.search(r"Leukocyte\s*Esterase[:\s]+(negative|positive)", text, re.IGNORECASE)
-        if m: chem_data["leukocyte_esterase"] = m.group(1).lower()
-        m = re.search(r"Microalbumin[:\s]+([\d\.]+)\s*mg/day", text, re.IGNORECASE)
-        if m: chem_data["microalbumin"] = float(m.group(1))
-        if chem_data:
-            data["chem_data"] = chem_data
-    except Exception as e:
-        logger.error(f"Error parsing chemical data: {e}")
+        return float(value)
+    except ValueError:
+        return 0.0
+
+def _present(value):
+    return True
+
+_NUMBER = r"[:\s]+([\d\.]+)"
+_WORDS = r"[:\s]+([\w\s]+)"
+_SIGN = r"[:\s]+(negative|positive)"
+_strip = str.strip
+_lower = str.lower
+
+# Label -> fields read from the value that follows it. Each field keeps the
+# first occurrence whose value pattern matches, like a re.search per field.
+# Labels are lowercase patterns matched against the lowercased report; the
+# second item lists the label's spellings with whitespace and '-' removed,
+# which is how a matched label is dispatched to its fields.
+SCAN_RULES = [
+    (r"ph", ["ph"], [("chem.pH", _NUMBER, float)]),
+    (r"color", ["color"], [("chem.color", _WORDS, _strip)]),
+    (r"clarity", ["clarity"], [("chem.clarity", _WORDS, _strip)]),
+    (r"odor", ["odor"], [("chem.odor", _WORDS, _strip)]),
+    (r"specific\s*gravity", ["specificgravity"], [("chem.specific_gravity", _NUMBER, float)]),
+    (r"protein", ["protein"], [("chem.protein", _NUMBER + r"\s*mg/dL", float),
+                               ("rapid.protein", _SIGN, _lower)]),
+    (r"glucose", ["glucose"], [("chem.glucose", _SIGN, _lower), ("rapid.glucose", _SIGN, _lower)]),
+    (r"ketones", ["ketones"], [("chem.ketones", _SIGN, _lower)]),
+    (r"blood", ["blood"], [("chem.blood", _SIGN, _lower), ("rapid.blood", _SIGN, _lower)]),
+    (r"nitrites", ["nitrites"], [("chem.nitrites", _SIGN, _lower), ("rapid.nitrites", _SIGN, _lower)]),
+    (r"leukocyte_esterase", ["leukocyte_esterase"], [("rapid.leukocyte_esterase", _SIGN, _lower)]),
+    (r"leukocyte\s*esterase", ["leukocyteesterase"], [("chem.leukocyte_esterase", _SIGN, _lower)]),
+    (r"microalbumin", ["microalbumin"], [("chem.microalbumin", _NUMBER + r"\s*mg/day", float)]),
+    (r"rbc", ["rbc"], [("microscopic.rbc", _NUMBER, float)]),
+    (r"wbc", ["wbc"], [("microscopic.wbc", _NUMBER, float)]),
+    (r"casts", ["casts"], [("microscopic.casts", _WORDS, _strip)]),
+    (r"crystals", ["crystals"], [("microscopic.crystals", _WORDS, _strip)]),
+    (r"epithelial\s*cells?", ["epithelialcell", "epithelialcells"],
+     [("microscopic.epithelial_cells", _NUMBER, float)]),
+    (r"bacterial\s*load", ["bacterialload"],
+     [("micro.bacterial_load", r"[:\s]+([\d\.e\+]+)", _float_or_zero)]),
+    (r"lactobacillus\s*gasseri", ["lactobacillusgasseri"],
+     [("composition.lactobacillus gasseri", _NUMBER, float)]),
+    (r"enterococcus\s*faecalis", ["enterococcusfaecalis"],
+     [("composition.enterococcus faecalis", _NUMBER, float)]),
+    (r"actinomyces\s*neuii", ["actinomycesneuii"], [("composition.actinomyces neuii", _NUMBER, float)]),
+    # Pathogen detection only accepts the exact single-space spelling
+    (r"escherichia coli", ["escherichia coli"], [("composition.escherichia coli", _NUMBER, float),
+                                                 ("pathogen.Escherichia coli", _NUMBER, float)]),
+    (r"escherichia\s*coli", ["escherichiacoli"], [("composition.escherichia coli", _NUMBER, float)]),
+    (r"klebsiella pneumoniae", ["klebsiellapneumoniae"],
+     [("pathogen.Klebsiella pneumoniae", _NUMBER, float)]),
+    (r"staphylococcus aureus", ["staphylococcusaureus"],
+     [("pathogen.Staphylococcus aureus", _NUMBER, float)]),
+    (r"resistance gene", ["resistancegene"], [("micro.resistance_genes", r"", _present)]),
+    (r"24[-\s]*(?:hour|hr)\s*urine\s*volume", ["24hoururinevolume", "24hrurinevolume"],
+     [("urine_volume", _NUMBER + r"\s*mL", float)]),
+    (r"pregnancy\s*test", ["pregnancytest"], [("pregnancy.result", r"[:\s]+(Positive|Negative)", _strip)]),
+    (r"hcg", ["hcg"], [("pregnancy.hcg", _NUMBER + r"\s*mIU/mL", float)]),
+]
+
+LABEL_KEY_RE = re.compile(r"[\s\-]+")
+# Normalised label spelling -> index into SCAN_RULES
+LABEL_RULES = {key: i for i, (_, keys, _) in enumerate(SCAN_RULES) for key in keys}
+RULE_FIELDS = [
+    [(field, re.compile(value, re.IGNORECASE), convert) for field, value, convert in fields]
+    for _, _, fields in SCAN_RULES
+]
+
+# Rules sharing a field with each rule; they may complete together
+RULE_PEERS = [
+    frozenset(j for j, other in enumerate(RULE_FIELDS)
+              if {f for f, _, _ in fields} & {f for f, _, _ in other})
+    for fields in RULE_FIELDS
+]
+
+@functools.lru_cache(maxsize=256)
+def label_regex(pending, ignorecase=False):
+    """
+    Plain (group-free) alternation of the labels still being looked for, so
+    the regex engine can use its prefix optimisations. Per-label capturing
+    groups would make every scan several times slower.
+    """
+    pattern = "|".join(SCAN_RULES[i][0] for i in sorted(pending))
+    return re.compile(pattern, re.IGNORECASE if ignorecase else 0)
 
-    try:
-        # Microscopic Analysis
-        m = re.search(r"RBC[:\s]+([\d\.]+)", text, re.IGNORECASE)
-        if m: microscopic_data["rbc"] = float(m.group(1))
-        m = re.search(r"WBC[:\s]+([\d\.]+)", text, re.IGNORECASE)
-        if m: microscopic_data["wbc"] = float(m.group(1))
-        m = re.search(r"Casts[:\s]+([\w\s]+)", text, re.IGNORECASE)
-        if m: microscopic_data["casts"] = m.group(1).strip()
-        m = re.search(r"Crystals[:\s]+([\w\s]+)", text, re.IGNORECASE)
-        if m: microscopic_data["crystals"] = m.group(1).strip()
-        m = re.search(r"Epithelial\s*cells?[:\s]+([\d\.]+)", text, re.IGNORECASE)
-        if m: microscopic_data["epithelial_cells"] = float(m.group(1))
-        if microscopic_data:
-            data["microscopic_data"] = microscopic_data
-    except Exception as e:
-        logger.error(f"Error parsing microscopic data: {e}")
+CHEM_KEYS = ["pH", "color", "clarity", "odor", "specific_gravity", "protein", "glucose",
+             "ketones", "blood", "nitrites", "leukocyte_esterase", "microalbumin"]
+MICROSCOPIC_KEYS = ["rbc", "wbc", "casts", "crystals", "epithelial_cells"]
+COMPOSITION_KEYS = ["lactobacillus gasseri", "enterococcus faecalis", "actinomyces neuii", "escherichia coli"]
+PATHOGENS = ["Escherichia coli", "Klebsiella pneumoniae", "Staphylococcus aureus"]
+RAPID_KEYS = ["nitrites", "leukocyte_esterase", "glucose", "protein", "blood"]
 
-    try:
-        # Microbiology
-        m = re.search(r"Bacterial\s*Load[:\s]+([\d\.e\+]+)", text, re.IGNORECASE)
-        if m:
+def scan_report(text):
+    """
+    Scan the report once, dispatching on each label found. Returns a flat
+    {field: value} dict holding the first matching value of every field.
+    Labels whose fields are all found drop out of the search pattern, and
+    the scan stops early once nothing is left to find.
+    """
+    found = {}
+    haystack = text.lower()
+    # Rare case-folding that changes length would misalign offsets with text
+    ignorecase = len(haystack) != len(text)
+    if ignorecase:
+        haystack = text
+    pending = frozenset(range(len(SCAN_RULES)))
+    regex = label_regex(pending, ignorecase)
+    pos = 0
+    while pending:
+        m = regex.search(haystack, pos)
+        if not m:
+            break
+        # Labels may overlap ("phcg 12 mIU/mL" holds ph and hcg), so the next
+        # search starts just after this label's start, not after its end
+        pos = m.start() + 1
+        label = m.group().lower()
+        rule = LABEL_RULES.get(label)
+        if rule is None:
+            rule = LABEL_RULES[LABEL_KEY_RE.sub("", label)]
+        for field, value_re, convert in RULE_FIELDS[rule]:
+            if field in found:
+                continue
+            v = value_re.match(text, m.end())
+            if not v:
+                continue
             try:
-                micro_data["bacterial_load"] = float(m.group(1))
-            except:
-                micro_data["bacterial_load"] = 0.0
-        m = re.search(r"Lactobacillus\s*gasseri[:\s]+([\d\.]+)", text, re.IGNORECASE)
-        if m:
-            micro_data.setdefault("microbial_composition", {})["lactobacillus gasseri"] = float(m.group(1))
-        m = re.search(r"Enterococcus\s*faecalis[:\s]+([\d\.]+)", text, re.IGNORECASE)
-        if m:
-            micro_data.setdefault("microbial_composition", {})["enterococcus faecalis"] = float(m.group(1))
-        m = re.search(r"Actinomyces\s*neuii[:\s]+([\d\.]+)", text, re.IGNORECASE)
-        if m:
-            micro_data.setdefault("microbial_composition", {})["actinomyces neuii"] = float(m.group(1))
-        m = re.search(r"Escherichia\s*coli[:\s]+([\d\.]+)", text, re.IGNORECASE)
-        if m:
-            micro_data.setdefault("microbial_composition", {})["escherichia coli"] = float(m.group(1))
-
-        detected = []
-        for pathogen in ["Escherichia coli", "Klebsiella pneumoniae", "Staphylococcus aureus"]:
-            pattern = re.compile(re.escape(pathogen) + r"[:\s]+([\d\.]+)", re.IGNORECASE)
-            m = pattern.search(text)
-            if m and float(m.group(1)) > 0:
-                detected.append(pathogen)
-        if detected:
-            micro_data["detected_pathogens"] = detected
-        if re.search(r"resistance gene", text, re.IGNORECASE):
-            micro_data["resistance_genes"] = ["Aminoglycoside resistance gene"]
-        if micro_data:
-            data["micro_data"] = micro_data
-    except Exception as e:
-        logger.error(f"Error parsing microbiology data: {e}")
-
-    try:
-        # 24-Hour Urine Volume
-        m = re.search(r"24[-\s]*(hour|hr)\s*urine\s*volume[:\s]+([\d\.]+)\s*mL", text, re.IGNORECASE)
-        if m:
-            data["urine_volume"] = float(m.group(2))
-    except Exception as e:
-        logger.error(f"Error parsing urine volume: {e}")
-
-    try:
-        # Rapid Urine Test
-        rapid_dict = {}
-        for param in ["nitrites", "leukocyte_esterase", "glucose", "protein", "blood"]:
-            m = re.search(param + r"[:\s]+(negative|positive)", text, re.IGNORECASE)
-            if m:
-                rapid_dict[param] = m.group(1).lower()
-        if rapid_dict:
-            data["rapid_data"] = rapid_dict
-    except Exception as e:
-        logger.error(f"Error parsing rapid urine data: {e}")
+                found[field] = convert(v.group(1) if v.re.groups else v.group())
+            except ValueError:
+                logger.debug("Skipping malformed value for %s: %r", field, v.group())
+        done = {i for i in RULE_PEERS[rule] & pending
+                if all(field in found for field, _, _ in RULE_FIELDS[i])}
+        if done:
+            pending = pending - done
+            if pending:
+                regex = label_regex(pending, ignorecase)
+    return found
+
+def label_hit_rate(text):
+    """
+    Share of the report labels in text for which scan_report reads a value;
+    low when OCR garbled the values. 0.0 if no label is present.
+    """
+    haystack = text.lower()
+    labels = {LABEL_RULES.get(label, LABEL_RULES.get(LABEL_KEY_RE.sub("", label)))
+              for label in label_regex(frozenset(range(len(SCAN_RULES)))).findall(haystack)}
+    labels.discard(None)
+    if not labels:
+        return 0.0
+    found = scan_report(text)
+    read = [i for i in labels if any(field in found for field, _, _ in RULE_FIELDS[i])]
+    return len(read) / len(labels)
+
+def _section(found, prefix, keys):
+    return {key: found[f"{prefix}.{key}"] for key in keys if f"{prefix}.{key}" in found}
 
-    try:
-        # Pregnancy Test
-        m = re.search(r"Pregnancy\s*Test[:\s]+(Positive|Negative)", text, re.IGNORECASE)
-        if m:
-            pregnancy_data["result"] = m.group(1)
-        else:
-            m = re.search(r"hCG[:\s]+([\d\.]+)\s*mIU/mL", text, re.IGNORECASE)
-            if m:
-                pregnancy_data["hcg"] = float(m.group(1))
-        if pregnancy_data:
-            data["pregnancy_data"] = pregnancy_data
-    except Exception as e:
-        logger.error(f"Error parsing pregnancy data: {e}")
+def parse_report_text(text):
+    data = {}
+    found = scan_report(text)
+
+    chem_data = _section(found, "chem", CHEM_KEYS)
+    if chem_data:
+        data["chem_data"] = chem_data
+
+    microscopic_data = _section(found, "microscopic", MICROSCOPIC_KEYS)
+    if microscopic_data:
+        data["microscopic_data"] = microscopic_data
+
+    micro_data = _section(found, "micro", ["bacterial_load"])
+    composition = _section(found, "composition", COMPOSITION_KEYS)
+    if composition:
+        micro_data["microbial_composition"] = composition
+    detected = [p for p in PATHOGENS if found.get(f"pathogen.{p}", 0) > 0]
+    if detected:
+        micro_data["detected_pathogens"] = detected
+    if "micro.resistance_genes" in found:
+        micro_data["resistance_genes"] = ["Aminoglycoside resistance gene"]
+    if micro_data:
+        data["micro_data"] = micro_data
+
+    if "urine_volume" in found:
+        data["urine_volume"] = found["urine_volume"]
+
+    rapid_data = _section(found, "rapid", RAPID_KEYS)
+    if rapid_data:
+        data["rapid_data"] = rapid_data
+
+    if "pregnancy.result" in found:
+        data["pregnancy_data"] = {"result": found["pregnancy.result"]}
+    elif "pregnancy.hcg" in found:
+        data["pregnancy_data"] = {"hcg": found["pregnancy.hcg"]}
 
     data["test_type"] = "full"
     return data
@@ -420,112 +579,133 @@ def parse_report_text(text):
 # ---------------------------
 # Custom Recommendations Mapping
 # ---------------------------
+# Finding code -> advice, in the order recommendations are listed
 RECOMMENDATIONS = {
     # Chemical Dipstick
-    "pH is out of the normal range": (
+    "ph_abnormal": (
         "Adjust dietary acid load: reduce high-acid foods (e.g., processed meat, soda) and "
         "increase fruits/vegetables to help normalize urine pH."
     ),
-    "Color '": (
+    "color_abnormal": (
         "Increase hydration and avoid foods/medications that can discolor urine (e.g., beets, rifampin)."
     ),
-    "Clarity": (
+    "clarity_abnormal": (
         "Maintain good fluid intake; if cloudiness persists, consider evaluation for infection or crystalluria."
     ),
-    "Odor": (
+    "odor_abnormal": (
         "Practice good hygiene; if a foul odor continues, seek evaluation for urinary tract infection."
     ),
-    "Specific Gravity": (
+    "specific_gravity_abnormal": (
         "Ensure adequate hydration; aim for 1.5–2 L of water per day unless contraindicated."
     ),
-    "Protein level": (
+    "protein_elevated": (
         "Control blood pressure and blood sugar; consider reducing salt intake and discuss ACE inhibitors with your doctor."
     ),
     # Microscopy
-    "RBC count": (
+    "rbc_elevated": (
         "Rule out stones or trauma; increase hydration and discuss imaging with your provider if bleeding persists."
     ),
-    "WBC count": (
+    "wbc_elevated": (
         "Suspect infection; consider a urine culture and appropriate antibiotics under medical supervision."
     ),
-    "casts": (
+    "casts_abnormal": (
         "Follow up for possible renal pathology; ensure hydration and consult nephrology if casts persist."
     ),
-    "crystals": (
+    "crystals_abnormal": (
         "Increase fluid intake; dietary modifications depending on crystal type (e.g., reduce oxalate for calcium oxalate stones)."
     ),
-    "Epithelial cells": (
+    "epithelial_cells_high": (
         "May indicate contamination—ensure clean-catch technique or repeat sample."
     ),
     # Microbiology
-    "High bacterial load": (
+    "bacterial_load_high": (
         "Start targeted antibiotics based on culture sensitivities; hydrate and monitor symptoms."
     ),
-    "Low proportion of beneficial bacteria": (
+    "beneficial_bacteria_low": (
         "Consider a probiotic with Lactobacillus spp. and dietary fiber to support healthy flora."
     ),
-    "Detected common pathogens": (
+    "pathogens_detected": (
         "Treat identified pathogen(s) with appropriate antibiotics as per local guidelines."
     ),
-    "Resistance genes detected": (
+    "resistance_genes": (
         "Notify your physician to choose antibiotics not compromised by detected resistance."
     ),
     # Volume
-    "is low (oliguria)": (
+    "volume_low": (
         "Assess hydration status—gently increase fluid intake; if oliguria persists, evaluate renal function."
     ),
-    "is high (polyuria)": (
+    "volume_high": (
         "Monitor fluid balance; evaluate for diabetes mellitus or endocrine causes if excessive."
     ),
     # Rapid & Pregnancy
-    "Rapid Urine Test: Abnormal": (
+    "rapid_abnormal": (
         "Follow up abnormal dipstick findings with microscopy and culture; consult your clinician."
     ),
-    "Pregnancy Test: Positive": (
+    "pregnancy_positive": (
         "Confirm with quantitative hCG and schedule obstetric evaluation early in pregnancy."
     ),
 }
+RECOMMENDATION_ORDER = {code: i for i, code in enumerate(RECOMMENDATIONS)}
+
+@functools.lru_cache(maxsize=512)
+def render_recommendations(codes):
+    """Render the [Recommendations] block for a frozenset of finding codes."""
+    matched = sorted((code for code in codes if code in RECOMMENDATIONS), key=RECOMMENDATION_ORDER.get)
+    if matched:
+        return "\n\n[Recommendations]\n" + "\n".join(f"- {RECOMMENDATIONS[code]}" for code in matched)
+    return (
+        "\n\n[Recommendations] All parameters are within normal limits. "
+        "Continue your current healthy regimen."
+    )
 
 # ---------------------------
 # Analyze Urine Report File
 # ---------------------------
-def analyze_urine_report_file(file_path):
-    ext = os.path.splitext(file_path)[1].lower()
+def analyze_urine_report(source, ext=None):
+    """
+    Extract, parse and evaluate a report. Returns (report, ok): ok is False
+    when a stage failed and the report is the error message for the user.
+    """
+    if ext is None:
+        ext = os.path.splitext(source)[1].lower()
     try:
-        text = extract_text(file_path, ext)
+        text = extract_text(source, ext)
         if not text:
-            return "No text could be extracted from the file."
+            if expired():
+                raise DeadlineExceeded("No text extracted within the request time budget")
+            count_failure('no_text')
+            return "No text could be extracted from the file.", False
+    except (Saturated, DeadlineExceeded):
+        raise
     except Exception as e:
         logger.error(f"Error during text extraction: {e}")
-        return "Error during text extraction."
+        count_failure('extraction_error')
+        return "Error during text extraction.", False
 
     try:
-        parsed_data = parse_report_text(text)
+        with stage('parse'):
+            parsed_data = parse_report_text(text)
     except Exception as e:
         logger.error(f"Error parsing report text: {e}")
-        return "Error parsing the report data."
+        count_failure('parse_error')
+        return "Error parsing the report data.", False
 
+    ok = True
     try:
-        analysis_report = analyze_urine_test(parsed_data)
+        with stage('analysis'):
+            sections = evaluate_urine_test(parsed_data)
+            analysis_report = render_report(sections)
+        codes = frozenset(f.code for _, findings in sections for f in findings if f.code)
     except Exception as e:
         logger.error(f"Error during urine test analysis: {e}")
-        analysis_report = "Error during urine analysis."
+        count_failure('analysis_error')
+        analysis_report, codes, ok = "Error during urine analysis.", frozenset(), False
 
-    # Build targeted recommendations
-    recs = []
-    for phrase, advice in RECOMMENDATIONS.items():
-        if phrase.lower() in analysis_report.lower():
-            recs.append(f"- {advice}")
+    with stage('recommendation'):
+        return analysis_report + render_recommendations(codes), ok
 
-    if recs:
-        recommendation_block = "\n\n[Recommendations]\n" + "\n".join(recs)
-    else:
-        recommendation_block = (
-            "\n\n[Recommendations] All parameters are within normal limits. "
-            "Continue your current healthy regimen."
-        )
-
-    return analysis_report + recommendation_block
+def analyze_urine_report_file(source, ext=None):
+    return analyze_urine_report(source, ext)[0]
 
 # ---------------------------
 # Flask Routes
@@ -537,53 +717,138 @@ def serve_react(path):
         return send_from_directory(app.template_folder, path)
     return send_from_directory(app.template_folder, 'index.html')
 
+def request_cid():
+    return request.cid
+
 @app.route('/diagnostics/upload', methods=['POST'])
+@profiled(request_cid)
+@limited
 def upload():
     if 'report' not in request.files:
+        count_failure('no_file')
         abort(400, 'No file part in the request')
     f = request.files['report']
     if not f.filename:
+        count_failure('no_file')
         abort(400, 'No file selected')
     filename = secure_filename(f.filename)
     ext = os.path.splitext(filename)[1].lower()
     if ext not in ALLOWED_EXT:
+        count_failure('unsupported_format')
         abort(400, 'Unsupported file format')
+    count_file(ext)
+    validate_upload(f.stream, ext)
+    content = f.read()
+    run_async = request.values.get('async', '').lower() in {'1', 'true', 'yes'}
+    cache_key = make_key(content, ext=ext)
+    analysis = result_cache.get(cache_key)
+    if analysis is not None:
+        request.logger.info("Analysis served from cache")
+        body = upload_response(request.cid, analysis)
+        if run_async:
+            return job_accepted(job_queue.add_finished(body))
+        return jsonify(body)
+
     save_name = f"{uuid.uuid4()}{ext}"
-    save_path = os.path.join(UPLOAD_DIR, save_name)
     try:
-        f.save(save_path)
+        source, spill_path = upload_source(content, save_name)
     except Exception as e:
         logger.error(f"Error saving file: {e}")
         abort(500, "Error saving the uploaded file.")
 
-    analysis = analyze_urine_report_file(save_path)
-
+    if run_async:
+        try:
+            job_id = job_queue.submit(run_upload_job, request.cid, cache_key, source, spill_path, ext)
+        except QueueFull:
+            if spill_path:
+                os.remove(spill_path)
+            request.logger.warning("Job queue full")
+            count_failure('queue_full')
+            return jsonify({'error': 'Server busy, retry later', 'correlationId': request.cid}), 503
+        request.logger.info(f"Queued as job {job_id}")
+        return job_accepted(job_id)
+
+    body, _ = run_upload_analysis(request.cid, cache_key, source, spill_path, ext)
+    return jsonify(body)
+
+def run_upload_analysis(cid, cache_key, source, spill_path, ext):
+    """Analyse an upload; returns (response body, whether the analysis succeeded)."""
     try:
-        os.remove(save_path)
-    except OSError as e:
-        request.logger.error(f"Error removing file: {e}")
-
-    return jsonify({
-        'reportId': request.cid,
+        analysis, ok = analyze_urine_report(source, ext)
+        # Only complete, successful reports are cached: a retry can finish a
+        # partial one, and error messages must not outlive their cause
+        if ok and not is_partial():
+            result_cache.put(cache_key, analysis)
+    finally:
+        if spill_path:
+            try:
+                os.remove(spill_path)
+            except OSError as e:
+                logger.error(f"Error removing file: {e}", extra={'cid': cid})
+    return upload_response(cid, analysis, is_partial()), ok
+
+def run_upload_job(*args):
+    # Background jobs get a time budget of their own; args[0] is the request's cid
+    with budget(), correlation(args[0]):
+        body, ok = run_upload_analysis(*args)
+    if not ok:
+        raise JobFailed(body['analysis']['report'], body)
+    return body
+
+def upload_response(cid, analysis, partial=False):
+    return {
+        'reportId': cid,
         'analysis': {
-            'status': 'processed',
+            'status': 'partial' if partial else 'processed',
             'port': PORT,
             'report': analysis
         }
+    }
+
+def job_accepted(job_id):
+    response = jsonify({'status': 'queued', 'jobId': job_id, 'correlationId': request.cid})
+    response.headers['Location'] = f'/jobs/{job_id}'
+    return response, 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job', 'correlationId': request.cid}), 404
+    return jsonify({
+        'jobId': job['id'],
+        'status': job['status'],
+        'result': job['result'],
+        'error': job['error'],
     })
 
 @app.route('/', methods=['GET', 'POST'])
+@profiled(request_cid)
+@limited
 def upload_file():
     """
     Handles file upload and displays analysis results.
     """
     if request.method == 'POST':
-        uploaded_file = request.files.get('file')
+        try:
+            uploaded_file = request.files.get('file')
+        except UploadRejected as e:
+            count_failure('rejected')
+            return render_template('index.html', error=str(e))
         if uploaded_file and uploaded_file.filename:
-            file_path = os.path.join('uploads', uploaded_file.filename)
-            uploaded_file.save(file_path)
-            result = analyze_urine_report_file(file_path)
-            os.remove(file_path)  # Clean up uploaded file after processing
+            ext = os.path.splitext(secure_filename(uploaded_file.filename))[1].lower()
+            count_file(ext)
+            try:
+                validate_upload(uploaded_file.stream, ext)
+            except UploadRejected as e:
+                count_failure('rejected')
+                return render_template('index.html', error=str(e))
+            source, spill_path = upload_source(uploaded_file.read(), f"{uuid.uuid4()}{ext}")
+            try:
+                result = analyze_urine_report_file(source, ext)
+            finally:
+                if spill_path:
+                    os.remove(spill_path)  # Clean up spilled upload after processing
             return render_template('result.html', result=result)
         else:
             return render_template('index.html', error="No file selected.")
@@ -593,6 +858,15 @@ def upload_file():
 def health():
     return jsonify({'status': 'ok', 'correlationId': request.cid})
 
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
 @app.errorhandler(404)
 def not_found(e):
     return jsonify({'error': 'Resource not found', 'correlationId': request.cid}), 404
@@ -601,6 +875,31 @@ def not_found(e):
 def bad_request(e):
     return jsonify({'error': str(e), 'correlationId': request.cid}), 400
 
+@app.errorhandler(413)
+def too_large(e):
+    count_failure('too_large')
+    return jsonify({'error': f'File too large (max {MAX_CONTENT_LENGTH} bytes)', 'correlationId': request.cid}), 413
+
+@app.errorhandler(UploadRejected)
+def upload_rejected(e):
+    request.logger.warning(f"Upload rejected: {e}")
+    count_failure('rejected')
+    return jsonify({'error': str(e), 'correlationId': request.cid}), e.status
+
+@app.errorhandler(Saturated)
+def saturated(e):
+    request.logger.warning(f"Rejected, OCR saturated: {e}")
+    count_failure('saturated')
+    response = jsonify({'error': 'Server busy, retry later', 'correlationId': request.cid})
+    response.headers['Retry-After'] = str(RETRY_AFTER)
+    return response, 503
+
+@app.errorhandler(DeadlineExceeded)
+def deadline_exceeded(e):
+    request.logger.warning(f"Timed out: {e}")
+    count_failure('deadline')
+    return jsonify({'error': 'Analysis timed out', 'correlationId': request.cid}), 504
+
 @app.errorhandler(500)
 def internal_error(e):
     return jsonify({'error': 'Internal Server Error', 'correlationId': request.cid}), 500
@@ -0,0 +1,90 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def make_key(content, **params):
+    """
+    Build a content-addressed cache key from the uploaded bytes and the
+    analysis parameters that influence the result.
+    """
+    digest = hashlib.sha256(content)
+    for name in sorted(params):
+        digest.update(f"\0{name}={params[name]}".encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache with TTL expiry and a bounded memory footprint.
+    Values must be JSON-serialisable; their encoded size is charged
+    against max_bytes.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=16 * 1024 * 1024, ttl=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = 0
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if self.ttl and expires_at < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        size = len(json.dumps(value, separators=(',', ':')))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._size += size
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
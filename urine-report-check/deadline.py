@@ -0,0 +1,72 @@
+import os
+import time
+import functools
+import contextvars
+from contextlib import contextmanager
+
+# Wall-clock budget for one analysis, in seconds (0 = unlimited). When it
+# runs out, running tesseract calls are killed, PDF page loops stop, and the
+# client gets the results extracted so far (marked partial) or a 504.
+REQUEST_BUDGET = float(os.environ.get('REQUEST_BUDGET', 60))
+
+
+class DeadlineExceeded(Exception):
+    """The current request's time budget ran out."""
+
+
+class Budget:
+    def __init__(self, seconds):
+        self.deadline = time.monotonic() + seconds if seconds else None
+        # Set when a stage stopped early and the result covers only part of the input
+        self.partial = False
+
+
+_budget = contextvars.ContextVar('budget', default=None)
+
+
+@contextmanager
+def budget(seconds=REQUEST_BUDGET):
+    """Run the enclosed work, and everything it calls, under a time budget."""
+    token = _budget.set(Budget(seconds))
+    try:
+        yield
+    finally:
+        _budget.reset(token)
+
+
+def limited(view):
+    """Decorator running a whole Flask view under REQUEST_BUDGET."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with budget():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def remaining():
+    """Seconds left in the current budget; None when there is no deadline."""
+    current = _budget.get()
+    if current is None or current.deadline is None:
+        return None
+    return max(0.0, current.deadline - time.monotonic())
+
+
+def expired():
+    return remaining() == 0.0
+
+
+def check():
+    """Raise DeadlineExceeded if the budget has run out."""
+    if expired():
+        raise DeadlineExceeded('Request time budget exhausted')
+
+
+def mark_partial():
+    current = _budget.get()
+    if current is not None:
+        current.partial = True
+
+
+def is_partial():
+    current = _budget.get()
+    return current is not None and current.partial
@@ -0,0 +1,70 @@
+import os
+import logging
+import pydicom
+from pydicom.pixels import iter_pixels  # pydicom 3+
+from preprocess import prepare_frame
+from concurrency import Saturated
+from deadline import DeadlineExceeded, expired, mark_partial
+
+logger = logging.getLogger('common.dicom_reader')
+
+# OCR burned-in report text from the pixel data when the header carries no
+# report text or the file declares BurnedInAnnotation (off by default)
+DICOM_OCR = os.environ.get('DICOM_OCR', '0') == '1'
+# At most this many frames are decoded, one at a time
+DICOM_OCR_MAX_FRAMES = int(os.environ.get('DICOM_OCR_MAX_FRAMES', 4))
+
+# Binary value representations never hold report text
+BINARY_VRS = {'OB', 'OD', 'OF', 'OL', 'OV', 'OW', 'UN'}
+
+
+def read_header(source, tags=None):
+    """
+    Read a DICOM file up to (not including) the pixel data. With tags, only
+    those elements are parsed; everything else is skipped over.
+    """
+    if tags is not None:
+        tags = list(tags) + ['BurnedInAnnotation', 'NumberOfFrames']
+    ds = pydicom.dcmread(source, stop_before_pixels=True, specific_tags=tags)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return ds
+
+
+def header_text(ds):
+    """'keyword: value' lines for every non-binary element of a dataset."""
+    return "\n".join(f"{e.keyword}: {e.value}" for e in ds
+                     if e.keyword and e.VR not in BINARY_VRS)
+
+
+def wants_ocr(ds, text):
+    return DICOM_OCR and (ds.get('BurnedInAnnotation', '') == 'YES' or not text.strip())
+
+
+def iter_frames(source, ds):
+    """Yield decoded frames one at a time, up to DICOM_OCR_MAX_FRAMES."""
+    frames = min(int(ds.get('NumberOfFrames', 1) or 1), DICOM_OCR_MAX_FRAMES)
+    yield from iter_pixels(source, indices=range(frames))
+
+
+def ocr_frames(source, ds, ocr):
+    """OCR the burned-in text of a DICOM file's frames; '' if there is no pixel data."""
+    texts = []
+    try:
+        for frame in iter_frames(source, ds):
+            if expired():
+                raise DeadlineExceeded('Request time budget exhausted')
+            texts.append(ocr(prepare_frame(frame)))
+    except DeadlineExceeded:
+        # Keep the frames read so far; the result is marked partial
+        mark_partial()
+    except Saturated:
+        # No OCR capacity: the request is turned away (503), not answered
+        # from the header alone
+        raise
+    except Exception as e:
+        logger.error(f'DICOM frame OCR failed: {e}')
+    finally:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+    return "\n".join(texts)
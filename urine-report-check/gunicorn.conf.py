@@ -0,0 +1,56 @@
+import os
+import glob
+import shutil
+import tempfile
+from concurrency import available_cpus
+
+# Production serving: gunicorn -c gunicorn.conf.py app:app
+# (each service's Dockerfile sets its PORT)
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+
+# One worker process per core the container may use, each serving a few
+# threads; OCR inside a worker is capped by its own slot semaphore
+cpus = available_cpus()
+workers = int(os.environ.get('WEB_CONCURRENCY', cpus))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+# Keep the accept queue short; connections beyond it are refused at once
+backlog = int(os.environ.get('GUNICORN_BACKLOG', 64))
+
+# Split the cores between workers; workers inherit this before importing app
+os.environ.setdefault('OCR_CONCURRENCY', str(max(1, cpus // workers)))
+
+# Per-process metric files, aggregated by /metrics. Unless one is given, a
+# fresh directory per start, so services sharing a host never aggregate each
+# other's files (a config reload keeps the master's, already in the env)
+_own_metrics_dir = 'PROMETHEUS_MULTIPROC_DIR' not in os.environ
+if _own_metrics_dir:
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = tempfile.mkdtemp(prefix='prometheus-')
+
+accesslog = '-'
+errorlog = '-'
+# Workers log JSON lines to stdout; one rotating file shared by several
+# processes would race on rollover
+os.environ.setdefault('LOG_DEST', 'stdout')
+
+
+def on_starting(server):
+    # Samples left over from a previous run in a given directory would be
+    # aggregated as live data
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, '*.db')):
+        os.remove(path)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    if _own_metrics_dir:
+        shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
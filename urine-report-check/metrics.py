@@ -0,0 +1,48 @@
+import os
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram,
+                               REGISTRY, generate_latest, multiprocess)
+
+# With several server worker processes, set PROMETHEUS_MULTIPROC_DIR to an
+# empty directory shared by the workers; each process writes its samples
+# there and /metrics aggregates them.
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+# OCR of a full page takes seconds, entity extraction well under a millisecond
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    'urine_stage_seconds', 'Time spent in each analysis pipeline stage',
+    ['stage'], buckets=STAGE_BUCKETS)
+FILES_TOTAL = Counter(
+    'urine_files_total', 'Uploaded report files by file type', ['file_type'])
+FAILURES_TOTAL = Counter(
+    'urine_failures_total', 'Failed analyses by reason', ['reason'])
+OCR_TIER_TOTAL = Counter(
+    'urine_ocr_tier_total', 'Image pages OCR\'d by tiered OCR, by the tier that produced the text', ['tier'])
+
+
+def stage(name):
+    """Context manager timing one pipeline stage."""
+    return STAGE_SECONDS.labels(name).time()
+
+
+def count_file(extension):
+    FILES_TOTAL.labels(extension.lstrip('.') or 'unknown').inc()
+
+
+def count_failure(reason):
+    FAILURES_TOTAL.labels(reason).inc()
+
+
+def count_ocr_tier(tier):
+    OCR_TIER_TOTAL.labels(tier).inc()
+
+
+def render():
+    """Return (body, content_type) in the Prometheus text format."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
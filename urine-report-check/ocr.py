@@ -0,0 +1,193 @@
+import os
+import re
+import queue
+import logging
+import threading
+from collections import namedtuple
+import pytesseract
+from concurrency import ocr_slot
+from deadline import DeadlineExceeded, remaining
+
+try:
+    import tesserocr  # optional: in-process engine, needs libtesseract at build time
+except ImportError:
+    tesserocr = None
+
+logger = logging.getLogger('flask_app')
+
+# 'auto' prefers the in-process tesserocr engine and falls back to pytesseract
+OCR_BACKEND = os.environ.get('OCR_BACKEND', 'auto')
+OCR_LANG = os.environ.get('OCR_LANG', 'eng')
+DEFAULT_CONFIG = ''
+PSM_RE = re.compile(r'--psm\s+(\d+)')
+
+# One recognised word: mean confidence 0-100 and its pixel box
+OcrWord = namedtuple('OcrWord', ['text', 'conf', 'left', 'top', 'right', 'bottom'])
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class PytesseractBackend:
+    """Runs the tesseract binary per call; language data is reloaded every time."""
+
+    name = 'pytesseract'
+
+    def __init__(self, lang=OCR_LANG):
+        self.lang = lang
+
+    def warm(self, engines=1):
+        pass
+
+    def _run(self, fn, image, config, **kwargs):
+        # pytesseract kills the tesseract process once timeout expires
+        try:
+            return fn(image, lang=self.lang, config=config, timeout=tesseract_timeout(), **kwargs)
+        except RuntimeError as e:
+            if 'timeout' in str(e).lower():
+                raise DeadlineExceeded('OCR stopped: request time budget exhausted') from e
+            raise
+
+    def image_to_string(self, image, config=''):
+        return self._run(pytesseract.image_to_string, image, config)
+
+    def image_to_data(self, image, config=''):
+        data = self._run(pytesseract.image_to_data, image, config, output_type=pytesseract.Output.DICT)
+        return [OcrWord(text, float(conf), left, top, left + width, top + height)
+                for text, conf, left, top, width, height in zip(
+                    data['text'], data['conf'], data['left'], data['top'], data['width'], data['height'])
+                if text.strip() and float(conf) >= 0]
+
+
+class TesserocrBackend:
+    """
+    Keeps pre-initialised tesseract engines in-process and reuses them across
+    requests. Engines are pooled rather than bound to threads, since the
+    development server starts a new thread per request.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, lang=OCR_LANG):
+        self.lang = lang
+        self._idle = queue.LifoQueue()
+        # Fail fast (RuntimeError) if the language data cannot be loaded
+        self._idle.put(self._new_engine())
+
+    def _new_engine(self):
+        return tesserocr.PyTessBaseAPI(lang=self.lang)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._new_engine()
+
+    def warm(self, engines=1):
+        for api in [self._acquire() for _ in range(engines)]:
+            self._idle.put(api)
+
+    def _psm(self, config):
+        m = PSM_RE.search(config)
+        return int(m.group(1)) if m else tesserocr.PSM.AUTO
+
+    def _recognize(self, api):
+        # Recognition is cancelled in-process once the timeout (ms) passes
+        timeout = tesseract_timeout()
+        if not api.Recognize(int(timeout * 1000)):
+            raise DeadlineExceeded('OCR stopped: request time budget exhausted')
+
+    def image_to_string(self, image, config=''):
+        api = self._acquire()
+        try:
+            api.SetPageSegMode(self._psm(config))
+            api.SetImage(image)
+            self._recognize(api)
+            return api.GetUTF8Text()
+        finally:
+            self._idle.put(api)
+
+    def image_to_data(self, image, config=''):
+        level = tesserocr.RIL.WORD
+        api = self._acquire()
+        try:
+            api.SetPageSegMode(self._psm(config))
+            api.SetImage(image)
+            self._recognize(api)
+            iterator = api.GetIterator()
+            if iterator is None:
+                return []
+            words = []
+            for word in tesserocr.iterate_level(iterator, level):
+                text = word.GetUTF8Text(level)
+                if text and text.strip():
+                    words.append(OcrWord(text, word.Confidence(level), *word.BoundingBox(level)))
+            return words
+        finally:
+            self._idle.put(api)
+
+
+def tesseract_timeout():
+    """Seconds a tesseract call may run under the current budget (0 = no limit)."""
+    left = remaining()
+    if left is None:
+        return 0
+    if left <= 0:
+        raise DeadlineExceeded('Request time budget exhausted before OCR')
+    return left
+
+
+def create_backend(name=OCR_BACKEND, lang=OCR_LANG):
+    if name in {'auto', 'tesserocr'}:
+        # tesserocr is in requirements.txt; running without it works but is slower
+        if tesserocr is None:
+            logger.warning('tesserocr is not installed, falling back to pytesseract')
+        else:
+            try:
+                return TesserocrBackend(lang)
+            except RuntimeError as e:
+                logger.warning(f'tesserocr init failed, falling back to pytesseract: {e}')
+    return PytesseractBackend(lang)
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+            logger.info(f'OCR backend: {_backend.name}')
+        return _backend
+
+
+def ocr_image(image, config=DEFAULT_CONFIG):
+    with ocr_slot():
+        return get_backend().image_to_string(image, config)
+
+
+def ocr_words(image, config=DEFAULT_CONFIG):
+    """OCR an image into OcrWords: text with confidence and position."""
+    with ocr_slot():
+        return get_backend().image_to_data(image, config)
+
+
+def group_rows(words):
+    """
+    Cluster OcrWords into text rows, top to bottom: a word whose vertical
+    centre falls inside the current row joins it. Returns [top, bottom, text].
+    """
+    rows = []
+    for word in sorted(words, key=lambda w: w.top + w.bottom):
+        centre = (word.top + word.bottom) / 2
+        if rows and rows[-1][0] <= centre <= rows[-1][1]:
+            row = rows[-1]
+            row[0], row[1] = min(row[0], word.top), max(row[1], word.bottom)
+            row[2].append(word)
+        else:
+            rows.append([word.top, word.bottom, [word]])
+    return [[top, bottom, ' '.join(w.text for w in sorted(row, key=lambda w: w.left))]
+            for top, bottom, row in rows]
+
+
+def words_to_text(words):
+    """Text of OcrWords, one line per row."""
+    return '\n'.join(text for _, _, text in group_rows(words))
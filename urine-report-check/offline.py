@@ -0,0 +1,167 @@
+"""
+Driver shared by both services' reprocess.py: walks report directories
+and manifests, runs each report through the service's process_report in a
+pool of worker processes, and appends one JSONL record per report. The
+output file is also the checkpoint: reports already in it are skipped.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+REPORT_EXTENSIONS = {'.pdf', '.png', '.jpg', '.jpeg', '.dcm'}
+
+# Reports waiting in the pool per worker; keeps every core busy without
+# queueing the whole archive in memory
+IN_FLIGHT_PER_WORKER = 2
+PROGRESS_EVERY = 100
+
+
+def iter_reports(paths, options):
+    """Yield (path, options) for every report file under the given directories or files."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in REPORT_EXTENSIONS:
+                        yield os.path.join(root, name), options
+        else:
+            yield path, options
+
+
+def iter_manifest(manifest, options, option=None):
+    """
+    Yield (path, options) per manifest line. With an option name, a line
+    may follow the path with ",<value>" to override it for that report.
+    """
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            value = ''
+            if option:
+                line, _, value = line.partition(',')
+                value = value.strip().lower()
+            yield os.path.join(base, line.strip()), {**options, option: value} if value else options
+
+
+def load_checkpoint(out_path):
+    """
+    Paths already recorded in the output. A partial last line left by a
+    crash is cut off so appended records start on a line of their own.
+    """
+    done = set()
+    if not os.path.exists(out_path):
+        return done
+    with open(out_path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        try:
+            done.add(json.loads(line)['path'])
+        except (ValueError, KeyError):
+            continue
+    return done
+
+
+def init_worker():
+    # One single-threaded tesseract per process scales best across cores;
+    # page OCR pools and warm-up threads only add contention here
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+    # Each worker logs to its own file (LOG_FILE with the pid appended)
+    os.environ.setdefault('LOG_DEST', 'pid-file')
+    os.environ['OCR_PAGE_WORKERS'] = '1'
+    os.environ['WARMUP_ON_START'] = '0'
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, os.getcwd())
+    import app  # noqa: F401  (import cost paid once per worker)
+
+
+def run_report(process_report, path, options):
+    """Run one report through process_report; always returns a JSON-able record."""
+    start = time.perf_counter()
+    record = {'path': path, **options}
+    try:
+        record.update(process_report(path, **options))
+    except Exception as e:
+        record.update(status='failed', error=f'{type(e).__name__}: {e}')
+    record['seconds'] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def reprocess(process_report, tasks, out_path, workers, fresh=False):
+    """Process (path, options) tasks into out_path; returns (written, skipped)."""
+    if fresh and os.path.exists(out_path):
+        os.remove(out_path)
+    done = load_checkpoint(out_path)
+    written = skipped = 0
+    start = time.perf_counter()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                               mp_context=multiprocessing.get_context('spawn'))
+    with pool, open(out_path, 'a', encoding='utf-8') as out:
+        pending = set()
+        tasks = iter(tasks)
+        while True:
+            for path, options in tasks:
+                path = os.path.abspath(path)
+                if path in done:
+                    skipped += 1
+                    continue
+                done.add(path)
+                pending.add(pool.submit(run_report, process_report, path, options))
+                if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                # Flushed per record so a crash loses at most the reports in flight
+                out.write(json.dumps(future.result()) + '\n')
+                out.flush()
+                written += 1
+                if written % PROGRESS_EVERY == 0:
+                    rate = written / (time.perf_counter() - start)
+                    print(f'{written} reports, {rate:.1f} reports/sec', file=sys.stderr)
+    return written, skipped
+
+
+def main(doc, process_report, option=None, choices=()):
+    """
+    Command line for a service's reprocess.py. process_report(path, **options)
+    returns the record's status fields; option names its one per-report
+    keyword argument (a --<option> flag and a manifest column), if any.
+    """
+    parser = argparse.ArgumentParser(description=doc.strip().splitlines()[0])
+    parser.add_argument('paths', nargs='*', help='report files or directories to walk')
+    parser.add_argument('--manifest', help='file listing one report per line')
+    parser.add_argument('--out', required=True, help='JSONL output, also the resume checkpoint')
+    if option:
+        parser.add_argument(f'--{option}', choices=choices, default=choices[0])
+    parser.add_argument('--workers', type=int, default=0, help='worker processes (default: available CPUs)')
+    parser.add_argument('--fresh', action='store_true', help='discard existing output instead of resuming')
+    args = parser.parse_args()
+    if not args.paths and not args.manifest:
+        parser.error('give report paths or --manifest')
+
+    from concurrency import available_cpus
+    workers = args.workers or available_cpus()
+    options = {option: getattr(args, option)} if option else {}
+    tasks = iter_reports(args.paths, options)
+    if args.manifest:
+        tasks = itertools.chain(tasks, iter_manifest(args.manifest, options, option))
+
+    start = time.perf_counter()
+    written, skipped = reprocess(process_report, tasks, args.out, workers, args.fresh)
+    elapsed = time.perf_counter() - start
+    print(f'Processed {written} reports in {elapsed:.1f}s with {workers} workers '
+          f'({written / elapsed if elapsed else 0:.1f} reports/sec), {skipped} already done',
+          file=sys.stderr)
@@ -0,0 +1,109 @@
+import os
+import cv2
+import numpy as np
+from PIL import Image
+
+# Scans above OCR_TARGET_DPI are downscaled to it; scans below OCR_MIN_DPI are
+# upscaled towards it. Anything in between is OCRed at native resolution.
+OCR_TARGET_DPI = int(os.environ.get('OCR_TARGET_DPI', 300))
+OCR_MIN_DPI = int(os.environ.get('OCR_MIN_DPI', 200))
+
+# Small crops are upscaled at most this much; larger factors add pixels, not detail
+MAX_UPSCALE = 2.0
+# Rescales within this ratio of 1.0 are skipped
+SCALE_TOLERANCE = 0.1
+
+# Long side of an A4 page in inches, used when the file carries no usable DPI
+PAGE_LONG_SIDE_IN = 11.69
+MIN_TRUSTED_DPI = 100
+
+
+def estimate_dpi(image):
+    """
+    Effective resolution of a scanned page. Embedded DPI is trusted when it
+    looks like a real scanner setting; camera photos usually carry 72 or
+    nothing, so fall back to assuming the image spans a full A4 page.
+    """
+    dpi = image.info.get('dpi')
+    if dpi:
+        try:
+            dpi = float(dpi[0])
+        except (TypeError, ValueError, IndexError):
+            dpi = None
+        if dpi and MIN_TRUSTED_DPI <= dpi <= 1200:
+            return dpi
+    return max(image.size) / PAGE_LONG_SIDE_IN
+
+
+def ocr_scale(image, target_dpi=OCR_TARGET_DPI):
+    return dpi_scale(estimate_dpi(image), target_dpi)
+
+
+def dpi_scale(dpi, target_dpi=OCR_TARGET_DPI):
+    if dpi > target_dpi:
+        return target_dpi / dpi
+    if dpi < OCR_MIN_DPI:
+        return min(target_dpi / dpi, MAX_UPSCALE)
+    return 1.0
+
+
+def load_gray(image, scale):
+    """
+    Decode an opened image as a grayscale array. For JPEGs a downscale is
+    folded into decoding (DCT scaling), so oversized photos are never fully
+    decoded. Returns (array, remaining_scale).
+    """
+    width, height = image.size
+    if image.format == 'JPEG' and scale < 1:
+        image.draft('L', (int(width * scale), int(height * scale)))
+    if image.mode not in {'L', 'RGB', 'RGBA'}:
+        image = image.convert('RGB')
+    arr = np.asarray(image)
+    if arr.ndim == 3:
+        arr = cv2.cvtColor(arr, cv2.COLOR_RGBA2GRAY if arr.shape[2] == 4 else cv2.COLOR_RGB2GRAY)
+    return arr, scale * width / arr.shape[1]
+
+
+def prepare_for_ocr(source, target_dpi=OCR_TARGET_DPI):
+    """
+    Load a scanned report from a path or file-like object and return a
+    binarised grayscale PIL image at roughly target_dpi: grayscale,
+    resample, median denoise, Otsu threshold.
+    """
+    return binarize(*load_page(source, target_dpi))
+
+
+def load_page(source, target_dpi=OCR_TARGET_DPI):
+    """Decode a scanned report to (grayscale array, scale still needed to reach target_dpi)."""
+    with Image.open(source) as image:
+        return load_gray(image, ocr_scale(image, target_dpi))
+
+
+def prepare_frame(frame, target_dpi=OCR_TARGET_DPI):
+    """
+    Same as prepare_for_ocr for a decoded image array, e.g. a DICOM frame of
+    any bit depth. The page is assumed to span the whole frame.
+    """
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    if frame.dtype != np.uint8:
+        frame = cv2.normalize(frame, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
+    return binarize(frame, dpi_scale(max(frame.shape) / PAGE_LONG_SIDE_IN, target_dpi))
+
+
+def resample(gray, scale):
+    if abs(scale - 1) > SCALE_TOLERANCE:
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=interpolation)
+    return gray
+
+
+def grayscale(gray, scale):
+    """The cheap preparation: grayscale at OCR resolution, no denoise or threshold."""
+    return Image.fromarray(resample(gray, scale))
+
+
+def binarize(gray, scale):
+    gray = cv2.medianBlur(resample(gray, scale), 3)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return Image.fromarray(binary)
@@ -0,0 +1,35 @@
+"""
+Re-run archived urine reports through the analysis pipeline offline.
+
+    python reprocess.py /archive/2023 /archive/2024 --out results.jsonl
+    python reprocess.py --manifest reports.txt --out results.jsonl --workers 8
+
+Each report goes through extract_text -> parse_report_text ->
+evaluate_urine_test in a pool of worker processes. Results are appended
+to the JSONL output as they finish, one line per report. The output file is
+also the checkpoint: run the same command again after a crash and reports
+already in it are skipped (--fresh starts over).
+
+Manifest lines are report paths; relative paths are resolved against the
+manifest.
+"""
+import os
+import offline
+
+
+def process_report(path):
+    from app import (extract_text, parse_report_text, evaluate_urine_test,
+                     render_report, render_recommendations)
+
+    text = extract_text(path, os.path.splitext(path)[1].lower())
+    if not text:
+        return {'status': 'error', 'error': 'No text'}
+    data = parse_report_text(text)
+    sections = evaluate_urine_test(data)
+    codes = frozenset(f.code for _, findings in sections for f in findings if f.code)
+    return {'status': 'ok', 'data': data,
+            'report': render_report(sections) + render_recommendations(codes)}
+
+
+if __name__ == '__main__':
+    offline.main(__doc__, process_report)
@@ -0,0 +1,75 @@
+"""
+parse_report_text must read the same data as the original parser, a
+re.search per field, now kept in benchmarks/bench_urine_parse.py.
+"""
+import os
+import sys
+import random
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(SERVICE_DIR), 'benchmarks'))
+
+from bench_urine_parse import legacy_parse_report_text, make_report  # noqa: E402
+
+LABELS = [
+    'pH', 'ph', 'Color', 'Clarity', 'Odor', 'Specific Gravity', 'SpecificGravity', 'Protein',
+    'Glucose', 'Ketones', 'Blood', 'Nitrites', 'leukocyte_esterase', 'Leukocyte Esterase',
+    'Microalbumin', 'RBC', 'WBC', 'Casts', 'Crystals', 'Epithelial cells', 'Epithelial cell',
+    'Bacterial Load', 'Lactobacillus gasseri', 'Enterococcus faecalis', 'Actinomyces neuii',
+    'Escherichia coli', 'Escherichia  coli', 'Klebsiella pneumoniae', 'Staphylococcus aureus',
+    'resistance gene', '24-hour urine volume', '24 hr urine volume', 'Pregnancy Test', 'hCG',
+    # Fragments that glue onto neighbouring labels
+    'p', 'h', 'c', 'g', 'cell', 'e', 's',
+]
+# Well-formed values only: on a malformed number the original parser drops
+# the whole section, where the scanner skips just that value
+VALUES = [': 12', ' 7.5', ': negative', ' positive', ': Positive', ' 3 mg/dL', ' 40 mg/day',
+          ' 1200 mL', ' 12  mIU/mL', ': Yellow', ' 1e5', ' 0', '', ' ', ':', 'x']
+SEPARATORS = ['', ' ', '\n', 'x']
+
+# Labels overlapping the previous label or its value
+OVERLAPPING = [
+    'phcg 12  mIU/mL',
+    'Epithelial cellSpecificGravity 12',
+    'RBC positivexEpithelial cellStaphylococcus aureus 40 mg/day',
+    'Epithelial cellStaphylococcus aureus 1200 mLKlebsiella pneumoniae 40 mg/day s positive',
+    'Specific GravitypH 6.5',
+]
+
+
+@pytest.fixture(scope='module')
+def app():
+    # app.py creates its upload dir and job store relative to the service
+    cwd = os.getcwd()
+    os.chdir(SERVICE_DIR)
+    sys.path.insert(0, SERVICE_DIR)
+    try:
+        import app
+        yield app
+    finally:
+        os.chdir(cwd)
+
+
+def fragments(rng):
+    return ''.join(rng.choice(LABELS) + rng.choice(VALUES) + rng.choice(SEPARATORS)
+                   for _ in range(rng.randint(1, 6)))
+
+
+@pytest.mark.parametrize('text', OVERLAPPING)
+def test_overlapping_labels(app, text):
+    assert app.parse_report_text(text) == legacy_parse_report_text(text)
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_generated_reports(app, seed):
+    text = make_report(3, seed=seed)
+    assert app.parse_report_text(text) == legacy_parse_report_text(text)
+
+
+def test_label_fragments(app):
+    rng = random.Random(0)
+    for _ in range(5000):
+        text = fragments(rng)
+        assert app.parse_report_text(text) == legacy_parse_report_text(text), text
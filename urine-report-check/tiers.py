@@ -0,0 +1,39 @@
+import os
+import logging
+import preprocess
+from ocr import ocr_image, ocr_words, words_to_text
+from metrics import stage, count_ocr_tier
+
+logger = logging.getLogger('flask_app')
+
+# The cheap pass is kept when its mean word confidence (0-100) and its
+# label hit rate (0-1) both reach these; otherwise the page is escalated
+OCR_TIER_MIN_CONF = float(os.environ.get('OCR_TIER_MIN_CONF', 75))
+OCR_TIER_MIN_HIT_RATE = float(os.environ.get('OCR_TIER_MIN_HIT_RATE', 0.8))
+
+
+def ocr_tiered(source, hit_rate, full_ocr=ocr_image):
+    """
+    OCR a scanned report in tiers. The page is decoded once; the 'light'
+    tier OCRs it only converted to grayscale at OCR resolution, reading word
+    confidences. If that pass is unsure or hit_rate(text) is low, the
+    'full' tier denoises and binarises the page and OCRs it with full_ocr.
+    """
+    with stage('preprocess'):
+        gray, scale = preprocess.load_page(source)
+        light = preprocess.grayscale(gray, scale)
+    with stage('ocr'):
+        words = ocr_words(light)
+    text = words_to_text(words)
+    conf = sum(w.conf for w in words) / len(words) if words else 0.0
+    rate = hit_rate(text)
+    if conf >= OCR_TIER_MIN_CONF and rate >= OCR_TIER_MIN_HIT_RATE:
+        count_ocr_tier('light')
+        return text
+
+    logger.info(f'Escalating OCR: confidence {conf:.0f}, label hit rate {rate:.2f}')
+    count_ocr_tier('full')
+    with stage('preprocess'):
+        image = preprocess.binarize(gray, scale)
+    with stage('ocr'):
+        return full_ocr(image)